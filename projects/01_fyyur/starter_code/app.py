@@ -3,8 +3,12 @@
 # ----------------------------------------------------------------------------#
 
 import dateutil.parser
+from datetime import timedelta
 import babel
-from flask import Flask, render_template, request, flash, redirect, url_for
+import babel.dates
+import functools
+import json
+from flask import Flask, Response, jsonify, render_template, request, flash, redirect, url_for, abort, stream_with_context
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -12,8 +16,21 @@ import logging
 from logging import Formatter, FileHandler
 from forms import *
 from common import GENRES
+from search import Search
+import pagination
+import explain
+import cache
+import importer
+import startup
+import metrics
+import profiler
+import routing
+import booking
+import timebuckets
+import click
 import psycopg2
-import re
+from sqlalchemy import event, exc, orm
+from sqlalchemy.dialects import postgresql
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
@@ -21,7 +38,29 @@ import re
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+db_metrics = metrics.Metrics(app)
+sql_profiler = profiler.SQLProfiler(app)
+replica_router = routing.ReplicaRouter(app, read_endpoints=['search_venues', 'search_artists', 'search_shows'])
+
+
+class PooledSQLAlchemy(SQLAlchemy):
+    # Pool settings from config.py, telemetry and profiling on every engine
+    # created, and sessions that route reads to the replica bind.
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super(PooledSQLAlchemy, self).apply_driver_hacks(app, sa_url, options)
+        options.update(metrics.pool_options(app.config, sa_url.get_backend_name()))
+        return sa_url, options
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super(PooledSQLAlchemy, self).create_engine(sa_url, engine_opts)
+        sql_profiler.watch(db_metrics.watch(engine))
+        return engine
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=routing.RoutingSession, db=self, **options)
+
+
+db = PooledSQLAlchemy(app)
 
 migrate = Migrate(app, db)
 
@@ -33,6 +72,10 @@ migrate = Migrate(app, db)
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_city_state', 'city', 'state'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -53,23 +96,36 @@ class VGenres(db.Model):
     __tablename__ = 'VGenres'
 
     genre = db.Column(db.Enum(GENRES), primary_key=True)
-    vid = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False, primary_key=True)
+    vid = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False, primary_key=True, index=True)
 
 class AGenres(db.Model):
     __tablename__ = 'AGenres'
 
     agenre = db.Column(db.Enum(GENRES), primary_key=True)
-    aid = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False, primary_key=True)
+    aid = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False, primary_key=True, index=True)
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_vid_start_time', 'vid', 'start_time'),
+        db.Index('ix_Show_aid_start_time', 'aid', 'start_time'),
+        db.Index('ix_Show_start_time', 'start_time'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     vid = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
     aid = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     start_time = db.Column(db.TIMESTAMP, nullable=False)
+    # minutes; on PostgreSQL exclusion constraints keep a venue's and an
+    # artist's [start_time, start_time + duration) ranges from overlapping
+    duration = db.Column(db.Integer, nullable=False, default=booking.DEFAULT_DURATION,
+                         server_default=str(booking.DEFAULT_DURATION))
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -84,20 +140,155 @@ class Artist(db.Model):
     shows = db.relationship("Show", backref="artist")
     genres = db.relationship("AGenres", backref="artist")
 
+
+
+# Denormalized show counters, one row per venue/artist that has shows. A row
+# is exact until its `next_show` starts (an upcoming show becomes a past one);
+# readers count such rows from Show instead (upcoming_show_count), and
+# `flask refresh-show-counts --due` rolls the stored rows over.
+class VenueShowCounts(db.Model):
+    __tablename__ = 'VenueShowCounts'
+
+    vid = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+    upcoming_shows = db.Column(db.Integer, nullable=False, default=0)
+    past_shows = db.Column(db.Integer, nullable=False, default=0)
+    next_show = db.Column(db.TIMESTAMP, index=True)
+
+
+class ArtistShowCounts(db.Model):
+    __tablename__ = 'ArtistShowCounts'
+
+    aid = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+    upcoming_shows = db.Column(db.Integer, nullable=False, default=0)
+    past_shows = db.Column(db.Integer, nullable=False, default=0)
+    next_show = db.Column(db.TIMESTAMP, index=True)
+
+
+SHOW_COUNTS = {
+    'vid': VenueShowCounts,
+    'aid': ArtistShowCounts,
+}
+
+
+def show_counts_select(key, now, ids=None):
+    fk = Show.__table__.c[key]
+    upcoming = Show.start_time > now
+    select = db.select([
+        fk,
+        db.func.sum(db.case([(upcoming, 1)], else_=0)),
+        db.func.sum(db.case([(upcoming, 0)], else_=1)),
+        db.func.min(db.case([(upcoming, Show.start_time)]))
+    ]).group_by(fk)
+    if ids is not None:
+        select = select.where(fk.in_(ids))
+    return select
+
+
+def refresh_show_counts(conn, now, ids=None):
+    # Rebuild counter rows from Show: all of them, or only the ids given per
+    # key ({'vid': [...], 'aid': [...]}). `conn` is a session or connection.
+    for key, counts in SHOW_COUNTS.items():
+        key_ids = None if ids is None else ids.get(key)
+        if ids is not None and not key_ids:
+            continue
+        table = counts.__table__
+        columns = [key, 'upcoming_shows', 'past_shows', 'next_show']
+        rows = show_counts_select(key, now, key_ids)
+        if db.engine.dialect.name == 'postgresql':
+            # Make sure every row exists and lock it before counting. Under
+            # READ COMMITTED a statement that waited for another writer's lock
+            # still counts from the snapshot it started with, so the counts
+            # are read by later statements, which see that writer's shows.
+            # Ids left without shows keep a zeroed row.
+            if key_ids is None:
+                create = postgresql.insert(table).from_select(
+                    [key], db.select([Show.__table__.c[key]]).distinct())
+            else:
+                create = postgresql.insert(table).values([{key: id} for id in sorted(set(key_ids))])
+            conn.execute(create.on_conflict_do_nothing(index_elements=[key]))
+            lock = db.select([table.c[key]]).order_by(table.c[key]).with_for_update()
+            reset = table.update().values(upcoming_shows=0, past_shows=0, next_show=None)
+            if key_ids is not None:
+                lock = lock.where(table.c[key].in_(key_ids))
+                reset = reset.where(table.c[key].in_(key_ids))
+            conn.execute(lock).fetchall()
+            conn.execute(reset)
+            upsert = postgresql.insert(table).from_select(columns, rows)
+            conn.execute(upsert.on_conflict_do_update(
+                index_elements=[key], set_=dict((c, upsert.excluded[c]) for c in columns[1:])))
+        else:
+            # SQLite serializes writers, so a plain rebuild cannot collide.
+            delete = table.delete()
+            if key_ids is not None:
+                delete = delete.where(table.c[key].in_(key_ids))
+            conn.execute(delete)
+            conn.execute(table.insert().from_select(columns, rows))
+
+
+def roll_over_show_counts(key, now):
+    # Rebuild the rows whose next show has started, in the caller's transaction.
+    counts = SHOW_COUNTS[key].__table__
+    due = [row[0] for row in db.session.execute(db.select([counts.c[key]]).where(counts.c.next_show <= now))]
+    if due:
+        refresh_show_counts(db.session, now, {key: due})
+    return len(due)
+
+
+def upcoming_show_count(key, now):
+    # The stored counter while it is exact, otherwise a count of the upcoming
+    # shows (a range scan on ix_Show_<key>_start_time), so reads never write.
+    # 0 for venues/artists without a counter row.
+    counts = SHOW_COUNTS[key]
+    fk = Show.__table__.c[key]
+    live = db.select([db.func.count()]).where(db.and_(fk == getattr(counts, key), Show.start_time > now)).label('live')
+    return db.func.coalesce(db.case([(counts.next_show <= now, live)], else_=counts.upcoming_shows), 0)
+
+
+@event.listens_for(Show, 'after_insert')
+@event.listens_for(Show, 'after_delete')
+def update_show_counts(mapper, connection, target):
+    # Same transaction as the show write, so the counters never disagree with it.
+    refresh_show_counts(connection, datetime.today(), {'vid': [int(target.vid)], 'aid': [int(target.aid)]})
+
+
+name_search = Search(app.config.get('SEARCH_BACKEND'))
+name_search.watch(Venue, Artist)
+page_cache = cache.ResponseCache(cache.make_backend(app.config))
+
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format_type='medium'):
-    date = dateutil.parser.parse(value)
-    if format_type == 'full':
-        format_type = "EEEE MMMM, d, y 'at' h:mma"
-    elif format_type == 'medium':
-        format_type = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format_type)
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@functools.lru_cache(maxsize=64)
+def datetime_pattern(format_type):
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format_type, format_type))
+
+
+@functools.lru_cache(maxsize=64)
+def datetime_locale(locale):
+    return babel.Locale.parse(locale)
+
+
+@functools.lru_cache(maxsize=4096)
+def formatted_datetime(value, format_type, locale):
+    # A page lists the same show times over and over; format each one once.
+    return datetime_pattern(format_type).apply(value, datetime_locale(locale))
+
+
+def format_datetime(value, format_type='medium', locale=None):
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    return formatted_datetime(value, format_type, locale or babel.dates.LC_TIME)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
+startup.use_bytecode_cache(app.jinja_env, app.config.get('TEMPLATE_CACHE_DIR'))
 
 
 # ----------------------------------------------------------------------------#
@@ -111,91 +302,138 @@ def index():
 
 #  Venues
 #  ----------------------------------------------------------------
-def get_idx(data, city, _state):
-    for i in range(0, len(data)):
-        if data[i].get('city') == city and data[i].get('state') == _state:
-            return i
+def venue_area_rows(now):
+    # Every venue with its area and upcoming show counter, one row per venue.
+    # The outer join keeps venues without shows.
+    upcoming = upcoming_show_count('vid', now).label('num_upcoming_shows')
+    return db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, upcoming) \
+        .outerjoin(VenueShowCounts, VenueShowCounts.vid == Venue.id) \
+        .order_by(Venue.state, Venue.city, Venue.id) \
+        .all()
+
+
+def group_venues_by_area(rows):
+    # (city, state) -> area dict, so grouping stays linear in the number of venues.
+    areas = {}
+    data = []
+    for row in rows:
+        key = (row.city, row.state)
+        area = areas.get(key)
+        if area is None:
+            area = areas[key] = {
+                "city": row.city,
+                "state": row.state,
+                "venues": []
+            }
+            data.append(area)
+        area["venues"].append({
+            "id": row.id,
+            "name": row.name,
+            "num_upcoming_shows": row.num_upcoming_shows
+        })
+    return data
 
-    return -1
 
 @app.route('/venues')
+@page_cache.cached
 def venues():
-    v = Venue.query.all()
-    data = []
-    for i in range(0, len(v)):
-        idx = get_idx(data, v[i].city, v[i].state)
-        v_dict = {
-            "id": v[i].id,
-            "name": v[i].name,
-            "num_upcoming_shows": len(v[i].shows)
-        }
-        if idx != -1:
-            data[idx].get('venues').append(v_dict)
-        else:
-            data.append({
-                "city": v[i].city,
-                "state": v[i].state,
-                "venues": [v_dict]
-            })
+    cache.tag('venues')
+    data = group_venues_by_area(venue_area_rows(datetime.today()))
     return render_template('pages/venues.html', areas=data)
 
 
+def search_rows(model, key, term, now):
+    # Matches from the configured search backend, each with its upcoming show
+    # counter, in one query.
+    counts = SHOW_COUNTS[key]
+    upcoming = upcoming_show_count(key, now).label('num_upcoming_shows')
+    return db.session.query(model.id, model.name, upcoming) \
+        .outerjoin(counts, getattr(counts, key) == model.id) \
+        .filter(name_search.criterion(db.session, model, term)) \
+        .order_by(model.name, model.id) \
+        .all()
+
+
+def search_results(rows):
+    data = [{
+        "id": row.id,
+        "name": row.name,
+        "num_upcoming_shows": row.num_upcoming_shows
+    } for row in rows]
+    return {
+        "count": len(data),
+        "data": data
+    }
+
+
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-    term = request.form.get('search_term')
-    raw = Venue.query.filter(Venue.name.ilike("%" + term + "%")).all()
-    data = list(map(lambda v: {
-        "id": v.id,
-        "name": v.name,
-        "num_upcoming_shows": len(list(filter(filter_upcoming_shows, v.shows)))
-    }, raw))
-    response = {
-        "count": len(data),
-        "data": data
-    }
+    term = request.form.get('search_term', '')
+    response = search_results(search_rows(Venue, 'vid', term, datetime.today()))
     return render_template('pages/search_venues.html', results=response,
                            search_term=request.form.get('search_term', ''))
 
 
-def filter_past_shows(show):
-    if(show.start_time > datetime.today()):
-        return False
-    else:
-        return True
-def filter_upcoming_shows(show):
-    if(show.start_time < datetime.today()):
-        return False
-    else:
-        return True
+def venue_show_rows(venue_id, now):
+    # A venue's shows joined to their artists in one query; `upcoming` is
+    # computed by the database so the past/upcoming split needs no second pass.
+    return db.session.query(
+        Show.aid, Show.start_time,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        (Show.start_time > now).label('upcoming')
+    ).join(Artist, Show.aid == Artist.id) \
+        .filter(Show.vid == venue_id) \
+        .order_by(Show.start_time) \
+        .all()
+def artist_show_rows(artist_id, now):
+    return db.session.query(
+        Show.vid, Show.start_time,
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link'),
+        (Show.start_time > now).label('upcoming')
+    ).join(Venue, Show.vid == Venue.id) \
+        .filter(Show.aid == artist_id) \
+        .order_by(Show.start_time) \
+        .all()
+def split_shows(rows, mapper):
+    past_shows = []
+    upcoming_shows = []
+    for row in rows:
+        (upcoming_shows if row.upcoming else past_shows).append(mapper(row))
+    return past_shows, upcoming_shows
 def map_show(show):
     return {
         "artist_id": show.aid,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": str(show.start_time)
+        "artist_name": show.artist_name,
+        "artist_image_link": show.artist_image_link,
+        "start_time": show.start_time
     }
 def map_show_artist(show):
     return {
         "venue_id": show.vid,
-        "venue_name": show.venue.name,
-        "venue_image_link": show.venue.image_link,
-        "start_time": str(show.start_time)
+        "venue_name": show.venue_name,
+        "venue_image_link": show.venue_image_link,
+        "start_time": show.start_time
     }
 @app.route('/venues/<int:venue_id>')
+@page_cache.cached
 def show_venue(venue_id):
-    v = Venue.query.get(venue_id)
+    # Two round-trips: the venue with its genres, then its shows with their artists.
+    v = Venue.query.options(db.joinedload(Venue.genres)).get(venue_id)
     if v is None:
         flash("Can't find such venue!")
         return redirect("/")
     else:
-        past_shows = list(filter(filter_past_shows, v.shows))
-        upcoming_shows = list(filter(filter_upcoming_shows, v.shows))
+        rows = venue_show_rows(venue_id, datetime.today())
+        cache.tag('venue:%d' % venue_id, *['artist:%d' % row.aid for row in rows])
+        past_shows, upcoming_shows = split_shows(rows, map_show)
         data = {
             "id": v.id,
-            "past_shows": list(map(map_show, past_shows)),
-            "upcoming_shows": list(map(map_show, upcoming_shows)),
+            "past_shows": past_shows,
+            "upcoming_shows": upcoming_shows,
             "past_shows_count": len(past_shows),
             "upcoming_shows_count": len(upcoming_shows),
             "name": v.name,
@@ -205,7 +443,7 @@ def show_venue(venue_id):
             "phone": v.phone,
             "image_link": v.image_link,
             "facebook_link": v.facebook_link,
-            "genres": map(lambda x: x.genre.value, VGenres.query.filter_by(vid=venue_id).all()),
+            "genres": [x.genre.value for x in v.genres],
             "website": v.website,
             "seeking_talent": v.seeking_talent,
             "seeking_description": v.seeking_description
@@ -213,6 +451,23 @@ def show_venue(venue_id):
         return render_template('pages/show_venue.html', venue=data)
 
 
+#  Genres
+#  ----------------------------------------------------------------
+def replace_genres(genre_model, genre_key, fk_key, entity_id, genres):
+    # Apply the difference between the stored genres and `genres` with one
+    # bulk DELETE and one multi-row INSERT, in the caller's transaction.
+    table = genre_model.__table__
+    owner = table.c[fk_key] == entity_id
+    old = set(genre.name for (genre,) in db.session.execute(db.select([table.c[genre_key]]).where(owner)))
+    new = set(genres)
+    removed = old - new
+    added = new - old
+    if removed:
+        db.session.execute(table.delete().where(db.and_(owner, table.c[genre_key].in_(sorted(removed)))))
+    if added:
+        db.session.execute(table.insert().values([{genre_key: genre, fk_key: entity_id} for genre in sorted(added)]))
+
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -243,12 +498,10 @@ def create_venue_submission():
         seeking_talent=get("seeking_talent") == 'YES'
     )
     db.session.add(venue)
+    db.session.flush()
+    replace_genres(VGenres, 'genre', 'vid', venue.id, request.form.getlist("genres"))
     db.session.commit()
-    _genres = request.form.getlist("genres")
-    for i in range(0, len(_genres)):
-        _genre = VGenres(genre=_genres[i], vid=venue.id)
-        db.session.add(_genre)
-    db.session.commit()
+    page_cache.invalidate('venues')
     # on successful db insert, flash success
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
     return redirect("/venues/" + str(venue.id))
@@ -260,11 +513,11 @@ def delete_venue(venue_id):
     try:
         v = Venue.query.get(int(venue_id))
         name = v.name
-        _genres = VGenres.query.filter_by(vid=venue_id).all()
-        for i in range(0, len(_genres)):
-            db.session.delete(_genres[i])
+        VGenres.query.filter_by(vid=v.id).delete(synchronize_session=False)
+        VenueShowCounts.query.filter_by(vid=v.id).delete(synchronize_session=False)
         db.session.delete(v)
         db.session.commit()
+        page_cache.invalidate('venues', 'venue:%d' % int(venue_id))
         flash("Deleted " + name + " Successfully")
     except Exception as e:
         flash(str(e))
@@ -276,48 +529,80 @@ def delete_venue(venue_id):
 
 #  Artists
 #  ----------------------------------------------------------------
+ARTISTS_PAGE_SIZE = 100
+
+
+ARTIST_INDEX_TTL = 60
+
+
+def load_artist_jump_index():
+    # [(letter, first name prefix, offset, count)] from one GROUP BY on the
+    # first character, in directory order.
+    initial = db.func.substr(Artist.name, 1, 1)
+    rows = db.session.query(initial, db.func.count()).group_by(initial).order_by(initial).all()
+    letters = {}
+    offset = 0
+    for char, count in rows:
+        letter = char.upper() if char and char.isalpha() else '#'
+        if letter not in letters:
+            letters[letter] = [letter, char or '', offset, 0]
+        letters[letter][3] += count
+        offset += count
+    return [tuple(entry) for entry in letters.values()]
+
+
+# Reloaded after an artist write commits here, or ARTIST_INDEX_TTL seconds
+# after the last load for writes made by other processes.
+artist_jump_index = cache.Memo(load_artist_jump_index, ARTIST_INDEX_TTL)
+cache.invalidate_on_commit(Artist, artist_jump_index.invalidate)
+
+
 @app.route('/artists')
+@page_cache.cached
 def artists():
-    _artists = Artist.query.all()
-    data = list(map(lambda artist: {
-        "id": artist.id,
-        "name": artist.name
-    }, _artists))
-
-    return render_template('pages/artists.html', artists=data)
+    # one keyset page of (id, name) rows in name order; ?from= jumps to the
+    # first name at or after a prefix, ?after= continues from a cursor
+    cache.tag('artists')
+    try:
+        after = pagination.decode_name_cursor(request.args['after']) if request.args.get('after') else None
+    except ValueError:
+        abort(400)
+    query = db.session.query(Artist.id, Artist.name)
+    if after is not None:
+        query = query.filter(pagination.after(Artist.name, Artist.id, after))
+    elif request.args.get('from'):
+        query = query.filter(Artist.name >= request.args['from'])
+    rows, next_cursor = pagination.page(query.order_by(Artist.name, Artist.id).limit(ARTISTS_PAGE_SIZE + 1),
+                                        ARTISTS_PAGE_SIZE, key=lambda row: (row.name, row.id),
+                                        encode=pagination.encode_name_cursor)
+    next_page = url_for('artists', after=next_cursor) if next_cursor is not None else None
+    return render_template('pages/artists.html', artists=rows, letters=artist_jump_index(), next_page=next_page)
 
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-    term = request.form.get('search_term')
-    raw = Artist.query.filter(Artist.name.ilike("%" + term + "%")).all()
-    data = list(map(lambda a: {
-        "id": a.id,
-        "name": a.name,
-        "num_upcoming_shows": len(list(filter(filter_upcoming_shows, a.shows)))
-    }, raw))
-    response = {
-        "count": len(data),
-        "data": data
-    }
+    term = request.form.get('search_term', '')
+    response = search_results(search_rows(Artist, 'aid', term, datetime.today()))
     return render_template('pages/search_artists.html', results=response,
                            search_term=request.form.get('search_term', ''))
 
 
 @app.route('/artists/<int:artist_id>')
+@page_cache.cached
 def show_artist(artist_id):
-    # shows the venue page with the given venue_id
-    a = Artist.query.get(artist_id)
+    # shows the artist page with the given artist_id, in two round-trips
+    a = Artist.query.options(db.joinedload(Artist.genres)).get(artist_id)
     if a is None:
         flash("Can't find such Artist!")
         return redirect("/")
     else:
-        past = list(filter(filter_past_shows, a.shows))
-        upcoming = list(filter(filter_upcoming_shows, a.shows))
+        rows = artist_show_rows(artist_id, datetime.today())
+        cache.tag('artist:%d' % artist_id, *['venue:%d' % row.vid for row in rows])
+        past, upcoming = split_shows(rows, map_show_artist)
         data = {
             "id": a.id,
-            "past_shows": list(map(map_show_artist, past)),
-            "upcoming_shows": list(map(map_show_artist, upcoming)),
+            "past_shows": past,
+            "upcoming_shows": upcoming,
             "past_shows_count": len(past),
             "upcoming_shows_count": len(upcoming),
             "name": a.name,
@@ -326,7 +611,7 @@ def show_artist(artist_id):
             "phone": a.phone,
             "image_link": a.image_link,
             "facebook_link": a.facebook_link,
-            "genres": map(lambda x: x.agenre.value, AGenres.query.filter_by(aid=artist_id).all()),
+            "genres": [x.agenre.value for x in a.genres],
             "website": a.website,
             "seeking_venue": a.seeking_venue,
             "seeking_description": a.seeking_description,
@@ -376,20 +661,9 @@ def edit_artist_submission(artist_id):
     artist.website = get('website')
     artist.seeking_venue = is_seeking
     artist.seeking_description = get('seeking_description')
-    # db.session.commit()
-    _old_genres = list(map(lambda x: x.agenre.name, artist.genres))
-    # delete all _old_genres...
-    for i in range(0, len(artist.genres)):
-        db.session.delete(artist.genres[i])
-
+    replace_genres(AGenres, 'agenre', 'aid', artist_id, request.form.getlist("genres"))
     db.session.commit()
-    # add new genre..
-    _genres = request.form.getlist("genres")
-    for i in range(0, len(_genres)):
-        _genre = AGenres(agenre=_genres[i], aid=artist_id)
-        db.session.add(_genre)
-    db.session.commit()
-
+    page_cache.invalidate('artist:%d' % artist_id)
 
     # on successful db insert, flash success
     flash('Artist ' + artist.name + ' was successfully Updated!')
@@ -437,19 +711,11 @@ def edit_venue_submission(venue_id):
         venue.website = get('website')
         venue.seeking_talent = is_seeking
         venue.seeking_description = get('seeking_description')
-        _old_genres = list(map(lambda x: x.genre.name, venue.genres))
-        # delete all _old_genres...
-        for i in range(0, len(venue.genres)):
-            db.session.delete(venue.genres[i])
-        db.session.commit()
-
-        # add new genre..
-        _genres = request.form.getlist("genres")
-        for i in range(0, len(_genres)):
-            _genre = VGenres(genre=_genres[i], vid=venue_id)
-            db.session.add(_genre)
+        replace_genres(VGenres, 'genre', 'vid', venue_id, request.form.getlist("genres"))
         db.session.commit()
+        page_cache.invalidate('venues', 'venue:%d' % venue_id)
     except Exception as e:
+        db.session.rollback()
         flash(str(e))
         return redirect('/venues/' + str(venue_id) + '/edit')
     # on successful db insert, flash success
@@ -489,32 +755,157 @@ def create_artist_submission():
         seeking_description=get("seeking_description") if is_seeking else ""
     )
     db.session.add(artist)
+    db.session.flush()
+    replace_genres(AGenres, 'agenre', 'aid', artist.id, request.form.getlist("genres"))
     db.session.commit()
-    _genres = request.form.getlist("genres")
-    for i in range(0, len(_genres)):
-        _genre = AGenres(agenre=_genres[i], aid=artist.id)
-        db.session.add(_genre)
-    db.session.commit()
+    page_cache.invalidate('artists')
     # on successful db insert, flash success
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
     return redirect("/artists/" + str(artist.id))
 
 #  Shows
 #  ----------------------------------------------------------------
+SEARCH_PAGE_SIZE = 50
+SHOWS_PAGE_SIZE = 100
+SHOWS_STREAM_CHUNK = 500
+
+def show_filters(args):
+    # Optional /shows filters from the query string; a malformed value is a 400.
+    try:
+        return {
+            "venue_id": args.get('venue_id', type=int),
+            "artist_id": args.get('artist_id', type=int),
+            "start": datetime.fromisoformat(args['start']) if args.get('start') else None,
+            "end": datetime.fromisoformat(args['end']) if args.get('end') else None,
+            "after": pagination.decode_cursor(args['after']) if args.get('after') else None
+        }
+    except ValueError:
+        abort(400)
+
+
+def show_listing_query(filters):
+    query = db.session.query(
+        Show.id, Show.vid, Show.aid, Show.start_time,
+        Venue.name.label('venue_name'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).join(Venue, Show.vid == Venue.id) \
+        .join(Artist, Show.aid == Artist.id)
+    if filters["venue_id"] is not None:
+        query = query.filter(Show.vid == filters["venue_id"])
+    if filters["artist_id"] is not None:
+        query = query.filter(Show.aid == filters["artist_id"])
+    if filters["start"] is not None:
+        query = query.filter(Show.start_time >= filters["start"])
+    if filters["end"] is not None:
+        query = query.filter(Show.start_time < filters["end"])
+    if filters["after"] is not None:
+        query = query.filter(pagination.after(Show.start_time, Show.id, filters["after"]))
+    return query.order_by(Show.start_time, Show.id)
+
+
+def map_listed_show(row):
+    return {
+        "venue_id": row.vid,
+        "venue_name": row.venue_name,
+        "artist_id": row.aid,
+        "artist_name": row.artist_name,
+        "artist_image_link": row.artist_image_link,
+        "start_time": row.start_time
+    }
+
+
+def stream_template(template_name, **context):
+    app.update_template_context(context)
+    return app.jinja_env.get_template(template_name).generate(context)
+
 
 @app.route('/shows')
+@page_cache.cached
 def shows():
-    _shows = Show.query.all()
-    data = list(map(lambda show: {
-        "venue_id": show.vid,
-        "venue_name": show.venue.name,
-        "artist_id": show.aid,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": str(show.start_time)
-    }, _shows))
-    # displays list of shows at /shows
-    return render_template('pages/shows.html', shows=data)
+    # displays list of shows at /shows, one keyset page at a time, or the
+    # whole filtered range streamed as it is fetched with ?stream=1
+    filters = show_filters(request.args)
+    query = show_listing_query(filters)
+    if request.args.get('stream'):
+        rows = query.yield_per(SHOWS_STREAM_CHUNK)
+        return Response(stream_with_context(stream_template(
+            'pages/shows.html', shows=(map_listed_show(row) for row in rows), next_page=None)))
+
+    rows, next_cursor = pagination.page(query.limit(SHOWS_PAGE_SIZE + 1), SHOWS_PAGE_SIZE,
+                                        key=lambda row: (row.start_time, row.id))
+    cache.tag('shows', *['venue:%d' % row.vid for row in rows] + ['artist:%d' % row.aid for row in rows])
+    next_page = None
+    if next_cursor is not None:
+        args = request.args.to_dict()
+        args['after'] = next_cursor
+        next_page = url_for('shows', **args)
+    return render_template('pages/shows.html', shows=[map_listed_show(row) for row in rows], next_page=next_page)
+
+
+def calendar_filters(args):
+    # /shows/calendar needs a start and end; city, state and bucket are optional.
+    try:
+        filters = {
+            "city": args.get('city'),
+            "state": args.get('state'),
+            "start": datetime.fromisoformat(args['start']),
+            "end": datetime.fromisoformat(args['end']),
+            "bucket": args.get('bucket', 'day')
+        }
+    except (KeyError, ValueError):
+        abort(400)
+    if filters["bucket"] not in timebuckets.UNITS or filters["end"] <= filters["start"]:
+        abort(400)
+    return filters
+
+
+def calendar_query(filters, *columns):
+    # a range scan on ix_Show_start_time, joined to the venue for the area
+    query = db.session.query(*columns).select_from(Show).join(Venue, Show.vid == Venue.id) \
+        .filter(Show.start_time >= filters["start"], Show.start_time < filters["end"])
+    if filters["city"]:
+        query = query.filter(Venue.city == filters["city"])
+    if filters["state"]:
+        query = query.filter(Venue.state == filters["state"])
+    return query
+
+
+def calendar_json_lines(rows):
+    for row in rows:
+        yield json.dumps({
+            "venue_id": row.vid,
+            "venue_name": row.venue_name,
+            "city": row.city,
+            "state": row.state,
+            "artist_id": row.aid,
+            "artist_name": row.artist_name,
+            "start_time": row.start_time.isoformat(),
+            "duration": row.duration
+        }) + "\n"
+
+
+@app.route('/shows/calendar')
+@page_cache.cached
+def show_calendar():
+    # number of shows per day or week in [start, end), optionally in one
+    # city/state; ?format=ndjson streams the shows themselves, one per line
+    filters = calendar_filters(request.args)
+    if request.args.get('format') == 'ndjson':
+        rows = calendar_query(
+            filters, Show.vid, Venue.name.label('venue_name'), Venue.city, Venue.state,
+            Show.aid, Artist.name.label('artist_name'), Show.start_time, Show.duration
+        ).join(Artist, Show.aid == Artist.id).order_by(Show.start_time, Show.id).yield_per(SHOWS_STREAM_CHUNK)
+        return Response(stream_with_context(calendar_json_lines(rows)), mimetype='application/x-ndjson')
+
+    cache.tag('shows', 'venues')
+    bucket = timebuckets.date_bucket(filters["bucket"], Show.start_time)
+    rows = calendar_query(filters, bucket, db.func.count(Show.id)).group_by(bucket).order_by(bucket).all()
+    return jsonify({
+        "bucket": filters["bucket"],
+        "buckets": [{"start": day.isoformat(), "count": count} for day, count in rows],
+        "total": sum(count for _, count in rows)
+    })
 
 
 @app.route('/shows/create')
@@ -524,6 +915,45 @@ def create_shows():
     return render_template('forms/new_show.html', form=form)
 
 
+def booking_index(shows, conn=None):
+    # Stored shows that could overlap any of [(vid, aid, start, end)]: same
+    # venue or artist, starting less than MAX_DURATION before the first one.
+    # `conn` is a connection, or None for the request's session.
+    conn = db.session if conn is None else conn
+    table = Show.__table__
+    vids = set(vid for vid, _, _, _ in shows)
+    aids = set(aid for _, aid, _, _ in shows)
+    rows = conn.execute(db.select([table.c.id, table.c.vid, table.c.aid, table.c.start_time, table.c.duration]).where(
+        db.and_(db.or_(table.c.vid.in_(vids), table.c.aid.in_(aids)),
+                table.c.start_time > min(start for _, _, start, _ in shows) - timedelta(minutes=booking.MAX_DURATION),
+                table.c.start_time < max(end for _, _, _, end in shows))))
+    index = booking.BookingIndex()
+    for row in rows:
+        index.book(row.vid, row.aid, row.start_time, booking.end_of(row.start_time, row.duration), ('show', row.id))
+    return index
+
+
+def booked_message(conflicts):
+    return " ".join("%s %d is already booked at that time." % (kind.capitalize(), id) for kind, id, _ in conflicts)
+
+
+def import_show_conflicts(conn, rows):
+    # flask import shows: rows overlapping a stored show or an earlier row of
+    # the batch are rejected before the batch is written.
+    intervals = [(row['vid'], row['aid'], row['start_time'], booking.end_of(row['start_time'], row['duration']))
+                 for row in rows]
+    _, rejected = booking_index(intervals, conn).schedule(intervals)
+    return dict((n, booked_message(found)) for n, found in rejected)
+
+
+def conflict_json(conflicts):
+    return [{
+        kind + "_id": id,
+        "shows": [owner for what, owner in owners if what == 'show'],
+        "requests": [owner for what, owner in owners if what == 'request']
+    } for kind, id, owners in conflicts]
+
+
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
@@ -534,15 +964,29 @@ def create_show_submission():
         flash(form.errors)
         return render_template('forms/new_show.html', form=form)
     try:
-        show = Show(
-            aid=get("artist_id"),
-            vid=get("venue_id"),
-            start_time=get("start_time")
-        )
+        vid, aid = int(get("venue_id")), int(get("artist_id"))
+    except ValueError:
+        flash("Didn't find either an artist or venue with such id...")
+        return render_template('forms/new_show.html', form=form)
+    start_time = form.start_time.data
+    duration = form.duration.data or booking.DEFAULT_DURATION
+    end_time = booking.end_of(start_time, duration)
+    conflicts = booking_index([(vid, aid, start_time, end_time)]).conflicts(vid, aid, start_time, end_time)
+    if conflicts:
+        flash(booked_message(conflicts))
+        return render_template('forms/new_show.html', form=form)
+    try:
+        show = Show(aid=aid, vid=vid, start_time=start_time, duration=duration)
         db.session.add(show)
         db.session.commit()
-    except psycopg2.errors.ForeignKeyViolation:
-        flash("Didn't find either an artist or venue with such id...")
+        page_cache.invalidate('shows', 'venue:%d' % vid, 'artist:%d' % aid)
+    except exc.IntegrityError as e:
+        db.session.rollback()
+        if isinstance(e.orig, psycopg2.errors.ExclusionViolation):
+            # booked by another request since the check above
+            flash("The venue or the artist is already booked at that time.")
+        else:
+            flash("Didn't find either an artist or venue with such id...")
         return render_template('forms/new_show.html', form=form)
     except Exception as e:
         flash(e)
@@ -552,27 +996,113 @@ def create_show_submission():
     return redirect("/shows")
 
 
+@app.route('/shows/bulk', methods=['POST'])
+def bulk_create_shows():
+    # Schedules a JSON list of shows ({venue_id, artist_id, start_time,
+    # duration}) in one pass: shows that conflict with a stored show or an
+    # earlier one in the list are reported, the others are created together.
+    records = request.get_json(silent=True)
+    if not isinstance(records, list):
+        abort(400)
+    errors, parsed = [], []
+    for n, record in enumerate(records):
+        try:
+            row, _ = importer.show_record(record)
+        except (ValueError, TypeError, AttributeError) as e:
+            errors.append({"index": n, "error": str(e)})
+            continue
+        del row['id']
+        parsed.append((n, row))
+    known_venues = importer.existing_ids(db.session, Venue.id, set(row['vid'] for _, row in parsed))
+    known_artists = importer.existing_ids(db.session, Artist.id, set(row['aid'] for _, row in parsed))
+    numbers, shows = [], []
+    for n, row in parsed:
+        if row['vid'] in known_venues and row['aid'] in known_artists:
+            numbers.append(n)
+            shows.append(row)
+        else:
+            errors.append({"index": n, "error": "Unknown venue or artist"})
+
+    conflicts = []
+    accepted = []
+    if shows:
+        intervals = [(row['vid'], row['aid'], row['start_time'], booking.end_of(row['start_time'], row['duration']))
+                     for row in shows]
+        accepted, rejected = booking_index(intervals).schedule(intervals)
+        # batch positions are reported as indexes into the posted list
+        conflicts = [{"index": numbers[i], "conflicts": conflict_json(
+            [(kind, id, [(what, numbers[owner] if what == 'request' else owner) for what, owner in owners])
+             for kind, id, owners in found])} for i, found in rejected]
+    rows = [shows[i] for i in accepted]
+    if rows:
+        try:
+            db.session.execute(Show.__table__.insert(), rows)
+            # Core inserts skip the ORM hooks that maintain the show counters.
+            refresh_show_counts(db.session, datetime.today(), {
+                'vid': sorted(set(row['vid'] for row in rows)),
+                'aid': sorted(set(row['aid'] for row in rows))
+            })
+            db.session.commit()
+        except exc.IntegrityError:
+            db.session.rollback()
+            return jsonify({"error": 409, "message": "Shows were booked concurrently, retry"}), 409
+        page_cache.invalidate('shows', *['venue:%d' % row['vid'] for row in rows] +
+                              ['artist:%d' % row['aid'] for row in rows])
+    return jsonify({
+        "created": len(rows),
+        "conflicts": sorted(conflicts, key=lambda c: c["index"]),
+        "errors": sorted(errors, key=lambda e: e["index"])
+    })
+
+
+def show_search_rows(term, limit, cursor=None):
+    # Show -> Artist -> Venue join filtered by the name search backend, one
+    # keyset page at a time, so the cost is bounded by `limit` and not by the
+    # size of the Show table.
+    query = db.session.query(
+        Show.id, Show.aid, Show.vid, Show.start_time,
+        Artist.name.label('artist_name'),
+        Venue.name.label('venue_name')
+    ).join(Artist, Show.aid == Artist.id) \
+        .join(Venue, Show.vid == Venue.id) \
+        .filter(db.or_(name_search.criterion(db.session, Artist, term),
+                       name_search.criterion(db.session, Venue, term)))
+    if cursor is not None:
+        query = query.filter(pagination.after(Show.start_time, Show.id, cursor))
+    return query.order_by(Show.start_time, Show.id).limit(limit + 1).all()
+
+
 @app.route('/shows/search', methods=['POST'])
 def search_shows():
-    term = request.form.get('search_term')
-    raw = Show.query.all()
-    data = list(map(lambda show: {
-        "artist_name": show.artist.name,
-        "venue_name": show.venue.name,
-        "start_time": str(show.start_time),
-        "artist_id": show.aid,
-        "venue_id": show.vid
-    }, list(filter(
-        lambda show: re.search(term, show.artist.name + " " + show.venue.name, re.IGNORECASE)
-        , raw))))
+    term = request.form.get('search_term', '')
+    cursor = request.form.get('after')
+    try:
+        cursor = pagination.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        abort(400)
+    rows, next_cursor = pagination.page(show_search_rows(term, SEARCH_PAGE_SIZE, cursor), SEARCH_PAGE_SIZE,
+                                        key=lambda row: (row.start_time, row.id))
+    data = [{
+        "artist_name": row.artist_name,
+        "venue_name": row.venue_name,
+        "start_time": row.start_time,
+        "artist_id": row.aid,
+        "venue_id": row.vid
+    } for row in rows]
     response = {
         "count": len(data),
-        "data": data
+        "data": data,
+        "next_cursor": next_cursor
     }
     return render_template('pages/search_shows.html', results=response,
                            search_term=request.form.get('search_term', ''))
 
 
+@app.route('/metrics')
+def metrics_view():
+    return Response(db_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -583,6 +1113,102 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
+@app.cli.command('explain')
+def explain_command():
+    """Print the query plans behind each read view."""
+    venue_id = db.session.query(db.func.min(Venue.id)).scalar() or 1
+    artist_id = db.session.query(db.func.min(Artist.id)).scalar() or 1
+    db.session.remove()
+    explain.explain_views(app, db.engine, [
+        ('GET', '/venues', None),
+        ('GET', '/venues/%d' % venue_id, None),
+        ('POST', '/venues/search', {'search_term': 'the'}),
+        ('GET', '/artists', None),
+        ('GET', '/artists/%d' % artist_id, None),
+        ('POST', '/artists/search', {'search_term': 'the'}),
+        ('GET', '/shows', None),
+        ('GET', '/shows?venue_id=%d' % venue_id, None),
+        ('GET', '/shows/calendar?start=2026-01-01&end=2027-01-01&city=San+Francisco&state=CA&bucket=week', None),
+        ('POST', '/shows/search', {'search_term': 'the'}),
+    ])
+
+
+@app.cli.command('refresh-show-counts')
+@click.option('--due', is_flag=True, help='Only roll over counters whose next show has started (for a cron job).')
+def refresh_show_counts_command(due):
+    """Rebuild the venue and artist show counters from the Show table."""
+    now = datetime.today()
+    if due:
+        for key in SHOW_COUNTS:
+            roll_over_show_counts(key, now)
+    else:
+        refresh_show_counts(db.session, now)
+    db.session.commit()
+    click.echo("%d venue and %d artist counters rebuilt" % (VenueShowCounts.query.count(), ArtistShowCounts.query.count()))
+
+
+@app.cli.command('startup-report')
+def startup_report_command():
+    """Print module import times and template compile times."""
+    modules = ['common', 'forms', 'app']
+    times = startup.import_times(modules, app.root_path)
+    click.echo("%-40s %10s %10s" % ("module import", "self ms", "total ms"))
+    for name in modules:
+        self_ms, total_ms = times.get(name, (0, 0))
+        click.echo("%-40s %10.1f %10.1f" % (name + ".py", self_ms, total_ms))
+    click.echo("")
+    compile_times = startup.template_compile_times(app.jinja_env)
+    click.echo("%-40s %10s" % ("template compile", "ms"))
+    for name, ms in compile_times:
+        click.echo("%-40s %10.1f" % (name, ms))
+    click.echo("%-40s %10.1f" % ("total", sum(ms for _, ms in compile_times)))
+
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path')
+@click.option('--batch-size', default=5000, help='Records written per transaction.')
+@click.option('--resume', is_flag=True, help='Continue from the last checkpoint of this file.')
+@click.option('--rejects', default=None, help='Append rejected records to this NDJSON file.')
+def import_command(kind, path, batch_size, resume, rejects):
+    """Bulk import venues, artists or shows from a CSV or NDJSON file.
+
+    Afterwards the page cache is cleared for every web worker only when it is
+    shared (CACHE_BACKEND = 'redis'). Caches held inside running workers
+    cannot be reached from this command: an 'lru' page cache keeps its pages
+    for up to CACHE_TTL seconds (until a restart when unset), the artist jump
+    index for up to ARTIST_INDEX_TTL seconds and the in-process name search
+    index (databases other than PostgreSQL) for up to search.INDEX_TTL
+    seconds.
+    """
+    targets = {
+        'venues': importer.Target(Venue.__table__, importer.venue_record, VGenres.__table__, 'genre', 'vid'),
+        'artists': importer.Target(Artist.__table__, importer.artist_record, AGenres.__table__, 'agenre', 'aid'),
+        'shows': importer.Target(Show.__table__, importer.show_record,
+                                 references=[('vid', Venue.__table__.c.id), ('aid', Artist.__table__.c.id)],
+                                 conflicts=import_show_conflicts),
+    }
+
+    def after_batch(conn, rows):
+        # Core writes skip the ORM hooks that maintain the show counters.
+        if kind == 'shows' and rows:
+            refresh_show_counts(conn, datetime.today(), {
+                'vid': sorted(set(row['vid'] for row in rows)),
+                'aid': sorted(set(row['aid'] for row in rows))
+            })
+
+    result = importer.run_import(db.engine, targets[kind], path, batch_size=batch_size, resume=resume,
+                                 rejects=rejects, after_batch=after_batch, echo=click.echo)
+    # only this process's copies; see the help text for the web workers'
+    name_search.reset()
+    artist_jump_index.invalidate()
+    page_cache.clear()
+    click.echo("done: %d imported, %d rejected" % (result.imported, result.rejected))
+    if not page_cache.shared:
+        click.echo("note: running web workers keep their cached pages for up to CACHE_TTL seconds; "
+                   "restart them to show the imported records at once")
+
+
 if not app.debug:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
@@ -593,6 +1219,10 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+if app.config.get('TEMPLATE_WARMUP'):
+    count, ms = startup.warm_templates(app.jinja_env)
+    app.logger.info('warmed %d templates in %.1f ms' % (count, ms))
+
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
@@ -0,0 +1,219 @@
+# ----------------------------------------------------------------------------#
+# Async JSON read API.
+#
+# A Quart app serving /api/venues, /api/artists and /api/shows (plus the
+# venue and artist detail endpoints) on an asyncio stack: SQLAlchemy's async
+# engine over asyncpg (aiosqlite for local SQLite files) with a bounded
+# connection pool. Queries are built from the same Venue/Artist/Show tables
+# as the Flask app; nothing here writes.
+#
+#   hypercorn async_api:api --bind 0.0.0.0:5001
+# ----------------------------------------------------------------------------#
+
+from datetime import datetime
+
+from quart import Quart, jsonify, request, abort
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import pagination
+from app import app as flask_app, Venue, Artist, Show, VGenres, AGenres, VenueShowCounts, upcoming_show_count
+
+api = Quart(__name__)
+api.config.from_object('config')
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+ASYNC_DRIVERS = {
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+venues_t = Venue.__table__
+artists_t = Artist.__table__
+shows_t = Show.__table__
+vgenres_t = VGenres.__table__
+agenres_t = AGenres.__table__
+venue_counts_t = VenueShowCounts.__table__
+
+
+def async_database_uri(config):
+    uri = config.get('ASYNC_DATABASE_URI') or flask_app.config['SQLALCHEMY_DATABASE_URI']
+    scheme, sep, rest = uri.partition('://')
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+@api.before_serving
+async def open_pool():
+    uri = async_database_uri(api.config)
+    options = {}
+    if not uri.startswith('sqlite'):
+        options = {
+            'pool_size': api.config.get('ASYNC_POOL_SIZE', 10),
+            'max_overflow': api.config.get('ASYNC_POOL_OVERFLOW', 5),
+            'pool_timeout': api.config.get('ASYNC_POOL_TIMEOUT', 30),
+            'pool_pre_ping': True,
+        }
+    api.engine = create_async_engine(uri, **options)
+
+
+@api.after_serving
+async def close_pool():
+    await api.engine.dispose()
+
+
+async def fetch_all(statement):
+    async with api.engine.connect() as conn:
+        result = await conn.execute(statement)
+        return result.fetchall()
+
+
+def page_size():
+    try:
+        return max(1, min(int(request.args.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        abort(400)
+
+
+def after_id():
+    try:
+        return int(request.args['after']) if request.args.get('after') else None
+    except ValueError:
+        abort(400)
+
+
+def show_json(row, other_id, other_name, other_image):
+    return {
+        other_id: row[0],
+        other_name: row[1],
+        other_image: row[2],
+        "start_time": row[3].isoformat()
+    }
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@api.route('/api/venues')
+async def venues():
+    limit = page_size()
+    statement = select([
+        venues_t.c.id, venues_t.c.name, venues_t.c.city, venues_t.c.state,
+        upcoming_show_count('vid', datetime.today())
+    ]).select_from(venues_t.outerjoin(venue_counts_t, venue_counts_t.c.vid == venues_t.c.id)) \
+        .order_by(venues_t.c.id).limit(limit + 1)
+    after = after_id()
+    if after is not None:
+        statement = statement.where(venues_t.c.id > after)
+    rows = await fetch_all(statement)
+    data = [{"id": r[0], "name": r[1], "city": r[2], "state": r[3], "num_upcoming_shows": r[4]} for r in rows[:limit]]
+    return jsonify({"venues": data, "next": data[-1]["id"] if len(rows) > limit else None})
+
+
+@api.route('/api/venues/<int:venue_id>')
+async def venue(venue_id):
+    now = datetime.today()
+    async with api.engine.connect() as conn:
+        v = (await conn.execute(select([venues_t]).where(venues_t.c.id == venue_id))).first()
+        if v is None:
+            abort(404)
+        genres = await conn.execute(select([vgenres_t.c.genre]).where(vgenres_t.c.vid == venue_id))
+        shows = await conn.execute(
+            select([shows_t.c.aid, artists_t.c.name, artists_t.c.image_link, shows_t.c.start_time])
+            .select_from(shows_t.join(artists_t, shows_t.c.aid == artists_t.c.id))
+            .where(shows_t.c.vid == venue_id).order_by(shows_t.c.start_time))
+        genres = [g[0].value for g in genres]
+        shows = shows.fetchall()
+    data = dict(v._mapping)
+    data["genres"] = genres
+    data["past_shows"] = [show_json(s, "artist_id", "artist_name", "artist_image_link") for s in shows if s[3] <= now]
+    data["upcoming_shows"] = [show_json(s, "artist_id", "artist_name", "artist_image_link") for s in shows if s[3] > now]
+    data["past_shows_count"] = len(data["past_shows"])
+    data["upcoming_shows_count"] = len(data["upcoming_shows"])
+    return jsonify(data)
+
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@api.route('/api/artists')
+async def artists():
+    limit = page_size()
+    statement = select([artists_t.c.id, artists_t.c.name]).order_by(artists_t.c.id).limit(limit + 1)
+    after = after_id()
+    if after is not None:
+        statement = statement.where(artists_t.c.id > after)
+    rows = await fetch_all(statement)
+    data = [{"id": r[0], "name": r[1]} for r in rows[:limit]]
+    return jsonify({"artists": data, "next": data[-1]["id"] if len(rows) > limit else None})
+
+
+@api.route('/api/artists/<int:artist_id>')
+async def artist(artist_id):
+    now = datetime.today()
+    async with api.engine.connect() as conn:
+        a = (await conn.execute(select([artists_t]).where(artists_t.c.id == artist_id))).first()
+        if a is None:
+            abort(404)
+        genres = await conn.execute(select([agenres_t.c.agenre]).where(agenres_t.c.aid == artist_id))
+        shows = await conn.execute(
+            select([shows_t.c.vid, venues_t.c.name, venues_t.c.image_link, shows_t.c.start_time])
+            .select_from(shows_t.join(venues_t, shows_t.c.vid == venues_t.c.id))
+            .where(shows_t.c.aid == artist_id).order_by(shows_t.c.start_time))
+        genres = [g[0].value for g in genres]
+        shows = shows.fetchall()
+    data = dict(a._mapping)
+    data["genres"] = genres
+    data["past_shows"] = [show_json(s, "venue_id", "venue_name", "venue_image_link") for s in shows if s[3] <= now]
+    data["upcoming_shows"] = [show_json(s, "venue_id", "venue_name", "venue_image_link") for s in shows if s[3] > now]
+    data["past_shows_count"] = len(data["past_shows"])
+    data["upcoming_shows_count"] = len(data["upcoming_shows"])
+    return jsonify(data)
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@api.route('/api/shows')
+async def shows():
+    limit = page_size()
+    statement = select([
+        shows_t.c.id, shows_t.c.vid, venues_t.c.name, shows_t.c.aid, artists_t.c.name,
+        artists_t.c.image_link, shows_t.c.start_time
+    ]).select_from(
+        shows_t.join(venues_t, shows_t.c.vid == venues_t.c.id).join(artists_t, shows_t.c.aid == artists_t.c.id)
+    ).order_by(shows_t.c.start_time, shows_t.c.id).limit(limit + 1)
+    if request.args.get('after'):
+        try:
+            cursor = pagination.decode_cursor(request.args['after'])
+        except ValueError:
+            abort(400)
+        statement = statement.where(pagination.after(shows_t.c.start_time, shows_t.c.id, cursor))
+    rows = await fetch_all(statement)
+    data = [{
+        "venue_id": r[1],
+        "venue_name": r[2],
+        "artist_id": r[3],
+        "artist_name": r[4],
+        "artist_image_link": r[5],
+        "start_time": r[6].isoformat()
+    } for r in rows[:limit]]
+    next_cursor = pagination.encode_cursor(rows[limit - 1][6], rows[limit - 1][0]) if len(rows) > limit else None
+    return jsonify({"shows": data, "next": next_cursor})
+
+
+@api.errorhandler(404)
+async def not_found_error(error):
+    return jsonify({"error": 404, "message": "Not found"}), 404
+
+
+@api.errorhandler(400)
+async def bad_request_error(error):
+    return jsonify({"error": 400, "message": "Bad request"}), 400
+
+
+if __name__ == '__main__':
+    api.run(port=5001)
@@ -0,0 +1,54 @@
+# ----------------------------------------------------------------------------#
+# The `datetime` template filter: the previous parse-then-format filter
+# against the cached one, over a page worth of show times rendered repeatedly.
+#
+#   python -m benchmarks.bench_datetime_filter [--shows 500] [--renders 20]
+# ----------------------------------------------------------------------------#
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from app import format_datetime, formatted_datetime
+
+
+def legacy_format_datetime(value, format_type='medium'):
+    date = dateutil.parser.parse(value)
+    if format_type == 'full':
+        format_type = "EEEE MMMM, d, y 'at' h:mma"
+    elif format_type == 'medium':
+        format_type = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format_type)
+
+
+def run(fn, values, renders):
+    start = time.perf_counter()
+    for _ in range(renders):
+        for value in values:
+            fn(value, 'full')
+    return (time.perf_counter() - start) * 1e6 / (renders * len(values))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shows', type=int, default=500)
+    parser.add_argument('--renders', type=int, default=20)
+    args = parser.parse_args()
+
+    now = datetime(2020, 5, 21, 21, 30)
+    times = [now + timedelta(hours=i) for i in range(args.shows)]
+    strings = [str(t) for t in times]
+
+    print("%-28s %10s" % ("filter", "us/call"))
+    print("%-28s %10.2f" % ("legacy (str, parse+format)", run(legacy_format_datetime, strings, args.renders)))
+    formatted_datetime.cache_clear()
+    print("%-28s %10.2f" % ("cached, first render", run(format_datetime, times, 1)))
+    print("%-28s %10.2f" % ("cached, warm", run(format_datetime, times, args.renders)))
+    print("%-28s %10.2f" % ("cached, str input", run(format_datetime, strings, args.renders)))
+
+
+if __name__ == '__main__':
+    main()
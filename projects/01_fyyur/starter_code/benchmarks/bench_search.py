@@ -0,0 +1,59 @@
+# ----------------------------------------------------------------------------#
+# Venue search latency versus table size: the previous unindexed
+# `ILIKE '%term%'` scan against the configured search backend.
+#
+#   python -m benchmarks.bench_search [--sizes 1000,10000,100000] [--database-uri URI]
+# ----------------------------------------------------------------------------#
+
+import argparse
+import time
+from datetime import datetime
+
+from app import app, db, name_search, Venue, search_rows
+from benchmarks.seed import use_database, seed, timed
+
+TERMS = ["hop", "music", "velvet lounge", "sax band 4", "zzz"]
+
+
+def scan_search(term):
+    # The previous search: a sequential ILIKE scan, then one lazy load of
+    # `shows` per hit to count upcoming ones.
+    now = datetime.today()
+    raw = Venue.query.filter(Venue.name.ilike("%" + term + "%")).all()
+    return [(v.id, len([s for s in v.shows if s.start_time >= now])) for v in raw]
+
+
+def indexed_search(term):
+    return search_rows(Venue, 'vid', term, datetime.today())
+
+
+def per_term(fn):
+    def run():
+        for term in TERMS:
+            fn(term)
+        db.session.remove()
+    return timed(run) / len(TERMS)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--database-uri', default=None)
+    args = parser.parse_args()
+
+    use_database(args.database_uri)
+    with app.app_context():
+        print("%8s  %-8s %12s %12s" % ("venues", "impl", "build ms", "ms/search"))
+        for size in [int(x) for x in args.sizes.split(',')]:
+            seed(size, shows_per_venue=1)
+            name_search.reset()
+            backend = name_search.backend(db.session).name
+            start = time.perf_counter()
+            indexed_search(TERMS[0])
+            build = (time.perf_counter() - start) * 1000
+            print("%8d  %-8s %12.1f %12.2f" % (size, backend, build, per_term(indexed_search)))
+            print("%8d  %-8s %12s %12.2f" % (size, "scan", "-", per_term(scan_search)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# ----------------------------------------------------------------------------#
+# /venues listing: query count and latency of the aggregated area query
+# against the previous lazy-loading implementation.
+#
+#   python -m benchmarks.bench_venues [--sizes 1000,10000,100000] [--legacy-max 10000]
+# ----------------------------------------------------------------------------#
+
+import argparse
+from datetime import datetime
+
+from app import app, db, Venue, venue_area_rows, group_venues_by_area
+from benchmarks.seed import use_database, seed, count_queries, timed
+
+
+def legacy_venues():
+    # The listing as it used to be: one query for the venues, one lazy load of
+    # `shows` per venue and a linear area lookup per row.
+    def get_idx(data, city, _state):
+        for i in range(0, len(data)):
+            if data[i].get('city') == city and data[i].get('state') == _state:
+                return i
+        return -1
+
+    v = Venue.query.all()
+    data = []
+    for i in range(0, len(v)):
+        idx = get_idx(data, v[i].city, v[i].state)
+        v_dict = {"id": v[i].id, "name": v[i].name, "num_upcoming_shows": len(v[i].shows)}
+        if idx != -1:
+            data[idx].get('venues').append(v_dict)
+        else:
+            data.append({"city": v[i].city, "state": v[i].state, "venues": [v_dict]})
+    return data
+
+
+def grouped_venues():
+    return group_venues_by_area(venue_area_rows(datetime.today()))
+
+
+def measure(fn):
+    def run():
+        fn()
+        db.session.remove()
+
+    with count_queries() as counter:
+        run()
+    return counter.count, timed(run)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--legacy-max', type=int, default=10000)
+    args = parser.parse_args()
+
+    use_database()
+    with app.app_context():
+        print("%8s  %-8s %8s %10s" % ("venues", "impl", "queries", "ms"))
+        for size in [int(x) for x in args.sizes.split(',')]:
+            seed(size)
+            queries, ms = measure(grouped_venues)
+            print("%8d  %-8s %8d %10.1f" % (size, "grouped", queries, ms))
+            if size <= args.legacy_max:
+                queries, ms = measure(legacy_venues)
+                print("%8d  %-8s %8d %10.1f" % (size, "legacy", queries, ms))
+
+
+if __name__ == '__main__':
+    main()
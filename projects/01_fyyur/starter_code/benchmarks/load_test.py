@@ -0,0 +1,74 @@
+# ----------------------------------------------------------------------------#
+# Throughput of the sync Flask views against the async JSON API on the same
+# data set. Start both servers against one database first, e.g.:
+#
+#   gunicorn -w 4 app:app -b :5000
+#   hypercorn -w 4 async_api:api -b :5001
+#   python -m benchmarks.load_test --sync http://localhost:5000 --async http://localhost:5001
+# ----------------------------------------------------------------------------#
+
+import argparse
+import threading
+import time
+import urllib.request
+
+PATHS = [
+    # (sync view, async endpoint)
+    ('/venues', '/api/venues'),
+    ('/venues/1', '/api/venues/1'),
+    ('/artists', '/api/artists'),
+    ('/artists/1', '/api/artists/1'),
+    ('/shows', '/api/shows'),
+]
+
+
+def hammer(url, concurrency, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url) as response:
+                    response.read()
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return {
+        'rps': len(latencies) / duration,
+        'p50': latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        'p95': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0,
+        'errors': errors[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sync', dest='sync_url', default='http://localhost:5000')
+    parser.add_argument('--async', dest='async_url', default='http://localhost:5001')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    print("%-16s %-6s %10s %10s %10s %8s" % ("endpoint", "stack", "req/s", "p50 ms", "p95 ms", "errors"))
+    for sync_path, async_path in PATHS:
+        for stack, url in (('sync', args.sync_url + sync_path), ('async', args.async_url + async_path)):
+            r = hammer(url, args.concurrency, args.duration)
+            print("%-16s %-6s %10.1f %10.1f %10.1f %8d" % (sync_path, stack, r['rps'], r['p50'], r['p95'], r['errors']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# ----------------------------------------------------------------------------#
+# Shared helpers for the benchmarks: a throw-away SQLite database seeded with
+# generated venues, artists and shows, plus a SQL statement counter.
+# ----------------------------------------------------------------------------#
+
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import app, db, Venue, Artist, Show, refresh_show_counts
+from common import phone_dict
+
+CHUNK = 5000
+WORDS = ["The", "Musical", "Hop", "Park", "Square", "Live", "Music", "Coffee", "Dueling", "Pianos", "Bar",
+         "Guns", "Petals", "Wild", "Sax", "Band", "Blue", "Note", "Velvet", "Lounge", "Echo", "Hall",
+         "Golden", "Gate", "Jazz", "Club", "Rock", "Garden", "Silver", "Moon", "Harbor", "Stage"]
+
+
+def make_name(rnd, i):
+    return " ".join(rnd.choice(WORDS) for _ in range(3)) + " %d" % i
+
+
+def use_database(uri=None):
+    # Must run before the first query so Flask-SQLAlchemy builds the engine for it.
+    if uri is None:
+        uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    return uri
+
+
+def _insert(table, rows):
+    for i in range(0, len(rows), CHUNK):
+        db.session.execute(table.insert(), rows[i:i + CHUNK])
+
+
+def seed(venues, artists=None, shows_per_venue=2, cities=200, rnd=None):
+    rnd = rnd or random.Random(1234)
+    artists = artists or max(1, venues // 2)
+    states = list(phone_dict.keys())
+    areas = [("City %d" % i, states[i % len(states)]) for i in range(cities)]
+    now = datetime.today()
+
+    db.drop_all()
+    db.create_all()
+    venue_rows = []
+    for i in range(1, venues + 1):
+        city, state = rnd.choice(areas)
+        venue_rows.append({
+            "id": i, "name": make_name(rnd, i), "city": city, "state": state,
+            "address": "%d Main St" % i, "phone": "000-000-0000",
+            "image_link": "https://example.com/v%d.png" % i, "seeking_talent": False
+        })
+    _insert(Venue.__table__, venue_rows)
+    artist_rows = []
+    for i in range(1, artists + 1):
+        city, state = rnd.choice(areas)
+        artist_rows.append({
+            "id": i, "name": make_name(rnd, i), "city": city, "state": state,
+            "image_link": "https://example.com/a%d.png" % i, "seeking_venue": False
+        })
+    _insert(Artist.__table__, artist_rows)
+    show_rows = []
+    for vid in range(1, venues + 1):
+        for _ in range(shows_per_venue):
+            show_rows.append({
+                "vid": vid,
+                "aid": rnd.randint(1, artists),
+                "start_time": now + timedelta(days=rnd.randint(-365, 365), minutes=rnd.randint(0, 1439))
+            })
+    _insert(Show.__table__, show_rows)
+    # Core inserts bypass the ORM hooks that maintain the counters.
+    refresh_show_counts(db.session, now)
+    db.session.commit()
+
+
+class QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    event.listen(db.engine, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', counter)
+
+
+def timed(fn, repeat=3):
+    # Best of `repeat` runs, in milliseconds.
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
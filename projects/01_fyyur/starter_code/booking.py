@@ -0,0 +1,83 @@
+import bisect
+from datetime import timedelta
+
+# ----------------------------------------------------------------------------#
+# Booking conflicts.
+#
+# A show occupies its venue and its artist for [start_time, start_time +
+# duration). On PostgreSQL an exclusion constraint rejects overlapping
+# bookings; here the same check runs in memory so it can be reported before
+# writing, for one show or a whole batch, on any database.
+#
+# Bookings of one venue (or artist) never overlap, so they are kept as sorted,
+# disjoint intervals: the ones overlapping a new show are a contiguous run
+# found with two bisections.
+# ----------------------------------------------------------------------------#
+
+DEFAULT_DURATION = 120  # minutes
+MAX_DURATION = 24 * 60
+
+
+def end_of(start_time, duration):
+    return start_time + timedelta(minutes=duration)
+
+
+class IntervalSet(object):
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.owners = []
+
+    def _run(self, start, end):
+        # First interval ending after `start`, first one starting at or after `end`.
+        return bisect.bisect_right(self.ends, start), bisect.bisect_left(self.starts, end)
+
+    def overlapping(self, start, end):
+        lo, hi = self._run(start, end)
+        return [owner for owners in self.owners[lo:hi] for owner in owners]
+
+    def add(self, start, end, owner):
+        # Overlapping intervals (only found in data written before the
+        # constraint) are merged so the set stays disjoint.
+        lo, hi = self._run(start, end)
+        owners = [owner]
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+            owners = [o for run in self.owners[lo:hi] for o in run] + owners
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+        self.owners[lo:hi] = [owners]
+
+
+class BookingIndex(object):
+    # One IntervalSet per venue and per artist. Owners are ('show', id) for
+    # stored shows and ('request', n) for shows booked from a batch.
+    def __init__(self):
+        self.sets = {}
+
+    def book(self, vid, aid, start, end, owner):
+        for key in (('venue', vid), ('artist', aid)):
+            self.sets.setdefault(key, IntervalSet()).add(start, end, owner)
+
+    def conflicts(self, vid, aid, start, end):
+        found = []
+        for key in (('venue', vid), ('artist', aid)):
+            booked = self.sets.get(key)
+            owners = booked.overlapping(start, end) if booked is not None else []
+            if owners:
+                found.append((key[0], key[1], owners))
+        return found
+
+    def schedule(self, shows):
+        # One pass over [(vid, aid, start, end)]: each show is checked against
+        # the stored ones and the ones accepted before it in the batch.
+        accepted, rejected = [], []
+        for n, (vid, aid, start, end) in enumerate(shows):
+            found = self.conflicts(vid, aid, start, end)
+            if found:
+                rejected.append((n, found))
+            else:
+                self.book(vid, aid, start, end, ('request', n))
+                accepted.append(n)
+        return accepted, rejected
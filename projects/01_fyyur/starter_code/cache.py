@@ -0,0 +1,262 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import g, make_response, request, session
+from sqlalchemy import event, orm
+
+import routing
+
+try:
+    import redis
+except ImportError:  # only needed for CACHE_BACKEND = 'redis'
+    redis = None
+
+# ----------------------------------------------------------------------------#
+# Response cache for the read pages.
+#
+# A cached entry is the rendered body of a GET page, keyed by path and query
+# string and tagged with the entities it shows ('venues', 'venue:1', ...).
+# Write handlers invalidate tags, which drops exactly the pages showing the
+# entities they changed. Entries carry an ETag so repeat visits get a 304.
+#
+# With a read replica, a page rendered from the replica just after a write may
+# not show it yet: such pages are served but not stored while any of their
+# tags was invalidated less than `lag` (REPLICA_STICKY_SECONDS) ago, and a
+# browser inside its own sticky window bypasses the cache altogether.
+# ----------------------------------------------------------------------------#
+
+
+class LRUBackend(object):
+    shared = False  # each process has its own entries
+
+    def __init__(self, maxsize=1024, ttl=None, lag=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lag = lag
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.invalidated = OrderedDict()  # tag -> last invalidation, oldest first
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            entry, tags, expires = item
+            if expires is not None and expires < time.time():
+                self._drop(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, tags=()):
+        with self.lock:
+            self._drop(key)
+            expires = time.time() + self.ttl if self.ttl else None
+            self.entries[key] = (entry, tuple(tags), expires)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while len(self.entries) > self.maxsize:
+                self._drop(next(iter(self.entries)))
+
+    def invalidate(self, *tags):
+        with self.lock:
+            now = time.time()
+            for tag in tags:
+                for key in list(self.tags.get(tag, ())):
+                    self._drop(key)
+                if self.lag:
+                    self.invalidated.pop(tag, None)
+                    self.invalidated[tag] = now
+            while self.invalidated and next(iter(self.invalidated.values())) < now - self.lag:
+                self.invalidated.popitem(last=False)
+
+    def recently_invalidated(self, tags):
+        with self.lock:
+            since = time.time() - self.lag
+            return any(self.invalidated.get(tag, 0) >= since for tag in tags)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tags.clear()
+            self.invalidated.clear()
+
+    def _drop(self, key):
+        item = self.entries.pop(key, None)
+        if item is None:
+            return
+        for tag in item[1]:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+
+class RedisBackend(object):
+    # Works with any client exposing the redis-py API (a local redis-server,
+    # or a stand-in such as fakeredis in development).
+    shared = True  # one cache for every process using the server
+
+    def __init__(self, client, ttl=None, prefix='fyyur:cache:', lag=0):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.lag = lag
+
+    def get(self, key):
+        entry = self.client.hgetall(self.prefix + key)
+        if not entry:
+            return None
+        return entry[b'body'], entry[b'mimetype'].decode(), entry[b'etag'].decode()
+
+    def set(self, key, entry, tags=()):
+        body, mimetype, etag = entry
+        key = self.prefix + key
+        pipe = self.client.pipeline()
+        pipe.hset(key, mapping={'body': body, 'mimetype': mimetype, 'etag': etag})
+        if self.ttl:
+            pipe.expire(key, self.ttl)
+        for tag in tags:
+            pipe.sadd(self.prefix + 'tag:' + tag, key)
+        pipe.execute()
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            tag_key = self.prefix + 'tag:' + tag
+            keys = self.client.smembers(tag_key)
+            self.client.delete(tag_key, *keys)
+            if self.lag:
+                self.client.set(self.prefix + 'invalidated:' + tag, 1, px=int(self.lag * 1000))
+
+    def recently_invalidated(self, tags):
+        if not self.lag or not tags:
+            return False
+        return self.client.exists(*[self.prefix + 'invalidated:' + tag for tag in tags]) > 0
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+def make_backend(config):
+    name = config.get('CACHE_BACKEND', 'lru')
+    ttl = config.get('CACHE_TTL')
+    lag = config.get('REPLICA_STICKY_SECONDS', 0)
+    if name == 'lru':
+        return LRUBackend(config.get('CACHE_MAXSIZE', 1024), ttl, lag)
+    if name == 'redis':
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND = 'redis' needs the redis package")
+        return RedisBackend(redis.Redis.from_url(config['CACHE_REDIS_URL']), ttl, lag=lag)
+    if name is None:
+        return None
+    raise ValueError("Unknown CACHE_BACKEND %r" % name)
+
+
+def tag(*tags):
+    # Called by a cached view while rendering to tag its page.
+    g.setdefault('cache_tags', set()).update(tags)
+
+
+class ResponseCache(object):
+    def __init__(self, backend=None):
+        self.backend = backend
+
+    def cached(self, f):
+        @wraps(f)
+        def view(*args, **kwargs):
+            # Pages rendered with pending flash messages are one-off, and a
+            # browser that has just written reads from the primary, not here.
+            if (self.backend is None or request.method != 'GET' or '_flashes' in session
+                    or session.get('primary_until', 0) > time.time()):
+                return f(*args, **kwargs)
+            key = request.full_path
+            entry = self.backend.get(key)
+            if entry is None:
+                g.cache_tags = set()
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                entry = (body, response.mimetype, hashlib.md5(body).hexdigest())
+                if not (routing.reads_from_replica() and self.backend.recently_invalidated(g.cache_tags)):
+                    self.backend.set(key, entry, g.cache_tags)
+            body, mimetype, etag = entry
+            response = make_response(body)
+            response.mimetype = mimetype
+            response.set_etag(etag)
+            return response.make_conditional(request)
+        return view
+
+    def invalidate(self, *tags):
+        if self.backend is not None:
+            self.backend.invalidate(*tags)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    @property
+    def shared(self):
+        # Whether invalidate() and clear() reach the other processes' pages.
+        return self.backend is None or self.backend.shared
+
+
+class Memo(object):
+    # One value computed by `load()` and shared by the requests of a process,
+    # reloaded after invalidate() or once `ttl` seconds old (the bound on how
+    # long other processes' writes go unseen). Callers must not modify it.
+    def __init__(self, load, ttl=60):
+        self.load = load
+        self.ttl = ttl
+        self.version = 0
+        self.lock = threading.Lock()
+        self._state = None  # (version, loaded at, value)
+
+    def _fresh(self, state):
+        return state is not None and state[0] == self.version and time.time() - state[1] < self.ttl
+
+    def invalidate(self):
+        self.version += 1
+
+    def __call__(self):
+        state = self._state
+        if not self._fresh(state):
+            with self.lock:
+                # another thread may have reloaded while this one waited
+                state = self._state
+                if not self._fresh(state):
+                    version = self.version
+                    state = self._state = (version, time.time(), self.load())
+        return state[2]
+
+
+def invalidate_on_commit(model, callback):
+    # Calls `callback` once a session that wrote `model` rows commits, so no
+    # reader can reload between the flush and the commit, and a rolled back
+    # write invalidates nothing.
+    # One flag per registration, so callbacks for the same model do not take
+    # each other's writes.
+    flag = ('written', model.__tablename__, object())
+
+    def written(mapper, connection, target):
+        orm.object_session(target).info[flag] = True
+
+    def committed(session):
+        if session.info.pop(flag, False):
+            callback()
+
+    def rolled_back(session):
+        session.info.pop(flag, None)
+
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, name, written)
+    event.listen(orm.Session, 'after_commit', committed)
+    event.listen(orm.Session, 'after_rollback', rolled_back)
@@ -0,0 +1,41 @@
+from sqlalchemy import event
+
+# ----------------------------------------------------------------------------#
+# `flask explain`: run each read view once through the test client, capture
+# the SQL it sends and print the database's plan for every statement.
+# ----------------------------------------------------------------------------#
+
+
+def capture_statements(engine, fn):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        fn()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return statements
+
+
+def plan(engine, statement, parameters):
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+    return [" | ".join(str(col) for col in row) for row in rows]
+
+
+def explain_views(app, engine, views, echo=print):
+    client = app.test_client()
+    for method, path, data in views:
+        echo("== %s %s" % (method, path))
+        statements = capture_statements(engine, lambda: client.open(path, method=method, data=data))
+        if not statements:
+            echo("   (no queries)")
+        for statement, parameters in statements:
+            echo("-- " + " ".join(statement.split()))
+            for line in plan(engine, statement, parameters):
+                echo("   " + line)
+        echo("")
@@ -1,8 +1,10 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, TextAreaField
-from wtforms.validators import DataRequired, AnyOf, URL, ValidationError
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, TextAreaField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, ValidationError, NumberRange, Optional
 from common import merged, GENRES, STATES, phone_dict
+from booking import DEFAULT_DURATION, MAX_DURATION
+from validation import check_state, check_genres, check_phone, check_seeking, check_seeking_description
 
 
 class ShowForm(Form):
@@ -17,22 +19,23 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default=datetime.today()
     )
+    duration = IntegerField(
+        'duration',
+        validators=[Optional(), NumberRange(min=1, max=MAX_DURATION)],
+        default=DEFAULT_DURATION
+    )
 
 
-s = [s.value for s in STATES]
+# Validators read sibling fields directly rather than through form.data,
+# which rebuilds a dict of every field on each access.
 
 
 def stateValidator(form, field):
-    if field.data not in s:
-        raise ValidationError("Invalid State")
-
-
-g = set([genre.name for genre in GENRES])
+    check_state(field.data)
 
 
 def genreValidator(form, field):
-    if not set(field.data).issubset(g):
-        raise ValidationError("Invalid Genre")
+    check_genres(field.data)
 
 
 genres = SelectMultipleField(
@@ -42,13 +45,7 @@ genres = SelectMultipleField(
 
 
 def phoneValidator(form, field):
-    # xxx-xxx-xxxx
-    # Phone number in USA: (area code 3 digits) (exchange 3 digits ) (number 4 digits)
-    # According to: https://www.quora.com/What-is-the-American-mobile-phone-number-format
-    possible = phone_dict[form.data.get("state")]
-
-    if len(field.data) != 12 or int(field.data[0:3]) not in possible or field.data[3] != "-" or field.data[7] != "-":
-        raise ValidationError("Invalid Phone Number, Must be exactly 12 characters")
+    check_phone(field.data, form.state.data)
 
 
 state = SelectField(
@@ -58,16 +55,14 @@ state = SelectField(
 
 
 def seekingValidator(form, field):
-    if field.data not in ['YES', 'NO']:
-        raise ValidationError("Invalid choice for Seeking talent")
+    check_seeking(field.data)
 
 
 def seekingDescriptionValidator(form, field):
-    isSeeking_1 = form.data.get("seeking_venue")
-    isSeeking_2 = form.data.get("seeking_talent")
-
-    if (isSeeking_1 == "YES" or isSeeking_2 == "YES") and len(field.data) == 0:
-        raise ValidationError("Cannot leave Seeking Description empty if seeking venue is true")
+    seeking = getattr(form, 'seeking_venue', None)
+    if seeking is None:
+        seeking = getattr(form, 'seeking_talent', None)
+    check_seeking_description(seeking.data if seeking is not None else "NO", field.data)
 
 class VenueForm(Form):
     name = StringField(
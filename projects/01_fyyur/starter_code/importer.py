@@ -0,0 +1,321 @@
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime
+
+import dateutil.parser
+from sqlalchemy import func, select
+
+import booking
+import validation
+
+# ----------------------------------------------------------------------------#
+# Bulk import of venues, artists and shows from CSV or NDJSON files.
+#
+# Records are streamed from the file, validated with the same rules as the
+# forms, and written a batch at a time (COPY on PostgreSQL, executemany
+# elsewhere), one transaction per batch. After each batch a checkpoint file
+# records how far the import got, so an interrupted run can be resumed.
+# Records with an id already in the table are rejected; the others get ids
+# reserved in their batch's transaction.
+# ----------------------------------------------------------------------------#
+
+GENRE_SEPARATOR = ';'
+
+
+def read_records(path):
+    # CSV by default; .ndjson/.jsonl files hold one JSON object per line.
+    if path.endswith(('.ndjson', '.jsonl')):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, newline='') as f:
+            for record in csv.DictReader(f):
+                yield record
+
+
+def text(record, name, required=True):
+    value = record.get(name)
+    value = value.strip() if isinstance(value, str) else value
+    if required and not value:
+        raise ValueError("Missing " + name)
+    return value or None
+
+
+def yes_no(value):
+    if isinstance(value, bool):
+        return 'YES' if value else 'NO'
+    value = (value or 'NO').strip().upper()
+    return {'TRUE': 'YES', 'FALSE': 'NO', 'Y': 'YES', 'N': 'NO'}.get(value, value)
+
+
+def genre_list(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(GENRE_SEPARATOR)
+    return [genre.strip() for genre in value if genre.strip()]
+
+
+def optional_id(record):
+    id = record.get('id')
+    return int(id) if id not in (None, '') else None
+
+
+def checked(record, kind):
+    errors = validation.validate(record, kind)
+    if errors:
+        raise ValueError("; ".join(errors.values()))
+
+
+def venue_record(record):
+    seeking = yes_no(record.get('seeking_talent'))
+    genres = genre_list(record.get('genres'))
+    row = {
+        'id': optional_id(record),
+        'name': text(record, 'name'),
+        'city': text(record, 'city'),
+        'state': text(record, 'state'),
+        'address': text(record, 'address'),
+        'phone': text(record, 'phone'),
+        'image_link': text(record, 'image_link', required=False),
+        'facebook_link': text(record, 'facebook_link', required=False),
+        'website': text(record, 'website', required=False),
+        'seeking_talent': seeking,
+        'seeking_description': text(record, 'seeking_description', required=False),
+        'genres': genres
+    }
+    checked(row, 'venue')
+    del row['genres']
+    row['seeking_talent'] = seeking == 'YES'
+    return row, genres
+
+
+def artist_record(record):
+    seeking = yes_no(record.get('seeking_venue'))
+    genres = genre_list(record.get('genres'))
+    row = {
+        'id': optional_id(record),
+        'name': text(record, 'name'),
+        'city': text(record, 'city'),
+        'state': text(record, 'state'),
+        'phone': text(record, 'phone'),
+        'image_link': text(record, 'image_link', required=False),
+        'facebook_link': text(record, 'facebook_link', required=False),
+        'website': text(record, 'website', required=False),
+        'seeking_venue': seeking,
+        'seeking_description': text(record, 'seeking_description', required=False),
+        'genres': genres
+    }
+    checked(row, 'artist')
+    del row['genres']
+    row['seeking_venue'] = seeking == 'YES'
+    if seeking != 'YES':
+        row['seeking_description'] = ""
+    return row, genres
+
+
+def start_time_value(value):
+    # Show times are stored without a time zone, so only naive times are
+    # accepted: a string or a datetime.
+    if value is None or value == '':
+        raise ValueError("Missing start_time")
+    if isinstance(value, str):
+        try:
+            value = dateutil.parser.parse(value)
+        except OverflowError:
+            raise ValueError("Invalid start_time %r" % value)
+    if not isinstance(value, datetime):
+        raise ValueError("Invalid start_time %r" % (value,))
+    if value.tzinfo is not None:
+        raise ValueError("start_time must not carry a time zone")
+    return value
+
+
+def show_record(record):
+    start_time = start_time_value(record.get('start_time'))
+    duration = int(record.get('duration') or booking.DEFAULT_DURATION)
+    if not 0 < duration <= booking.MAX_DURATION:
+        raise ValueError("Invalid duration %d" % duration)
+    return {
+        'id': optional_id(record),
+        'vid': int(text(record, 'venue_id')),
+        'aid': int(text(record, 'artist_id')),
+        'start_time': start_time,
+        'duration': duration
+    }, []
+
+
+class Target(object):
+    def __init__(self, table, record, genre_table=None, genre_key=None, fk_key=None, references=(), conflicts=None):
+        self.table = table
+        self.record = record
+        self.genre_table = genre_table
+        self.genre_key = genre_key
+        self.fk_key = fk_key
+        # (column in this table, referenced id column) pairs checked per batch
+        self.references = references
+        # conflicts(conn, rows) -> {position in rows: error}, checked per batch
+        self.conflicts = conflicts
+
+
+class Checkpoint(object):
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.imported = 0
+        self.rejected = 0
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                state = json.load(f)
+            self.offset = state['offset']
+            self.imported = state['imported']
+            self.rejected = state['rejected']
+        return self
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'offset': self.offset, 'imported': self.imported, 'rejected': self.rejected}, f)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def copy_rows(conn, table, rows):
+    # PostgreSQL COPY ... FROM STDIN through the connection's own transaction.
+    columns = list(rows[0].keys())
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([row[c] for c in columns])
+    buf.seek(0)
+    cursor = conn.connection.cursor()
+    cursor.copy_expert('COPY "%s" (%s) FROM STDIN WITH (FORMAT csv)' % (
+        table.name, ", ".join('"%s"' % c for c in columns)), buf)
+
+
+def write_rows(conn, table, rows):
+    if not rows:
+        return
+    if conn.dialect.name == 'postgresql':
+        copy_rows(conn, table, rows)
+    else:
+        conn.execute(table.insert(), rows)
+
+
+def chunked(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def existing_ids(conn, column, ids):
+    if not ids:
+        return set()
+    return set(row[0] for row in conn.execute(select([column]).where(column.in_(ids))))
+
+
+def reserve_ids(conn, table, count, floor=0):
+    # `count` new ids above `floor` (the largest explicit id in the batch),
+    # taken in the batch's transaction. On PostgreSQL they come from the
+    # serial sequence, moved past `floor` first, so rows inserted by the app
+    # while an import runs (or after one fails) never get the same ids.
+    if conn.dialect.name == 'postgresql':
+        sequence = func.pg_get_serial_sequence('"%s"' % table.name, 'id')
+        if floor:
+            conn.execute(select([func.setval(sequence, func.greatest(func.nextval(sequence), floor))]))
+        if not count:
+            return []
+        return [row[0] for row in conn.execute(select([func.nextval(sequence)]).select_from(
+            func.generate_series(1, count)))]
+    start = max(conn.execute(select([func.max(table.c.id)])).scalar() or 0, floor) + 1
+    return list(range(start, start + count))
+
+
+def run_import(engine, target, path, batch_size=5000, resume=False, rejects=None, after_batch=None, echo=print):
+    checkpoint = Checkpoint(path + '.checkpoint')
+    if resume:
+        checkpoint.load()
+    else:
+        checkpoint.remove()
+    rejects = open(rejects, 'a') if rejects else None
+    table = target.table
+    start = time.perf_counter()
+    imported = 0
+    records = enumerate(read_records(path))
+
+    def reject(number, raw, error):
+        checkpoint.rejected += 1
+        if rejects is not None:
+            rejects.write(json.dumps({'record': number, 'error': str(error), 'data': raw}, default=str) + "\n")
+
+    try:
+        for batch in chunked(records, batch_size):
+            if batch[-1][0] < checkpoint.offset:
+                continue
+            rows = []
+            for number, raw in batch:
+                if number < checkpoint.offset:
+                    continue
+                try:
+                    row, row_genres = target.record(raw)
+                except (ValueError, TypeError) as e:
+                    reject(number, raw, e)
+                    continue
+                rows.append((number, raw, row, row_genres))
+            with engine.begin() as conn:
+                explicit = [item for item in rows if item[2]['id'] is not None]
+                taken = existing_ids(conn, table.c.id, set(item[2]['id'] for item in explicit))
+                for item in explicit:
+                    if item[2]['id'] in taken:
+                        reject(item[0], item[1], "Duplicate id %s" % item[2]['id'])
+                        rows.remove(item)
+                    else:
+                        taken.add(item[2]['id'])
+                new = [row for _, _, row, _ in rows if row['id'] is None]
+                floor = max([row['id'] for _, _, row, _ in rows if row['id'] is not None] or [0])
+                for row, id in zip(new, reserve_ids(conn, table, len(new), floor)):
+                    row['id'] = id
+                for key, column in target.references:
+                    known = existing_ids(conn, column, set(row[key] for _, _, row, _ in rows))
+                    for item in [item for item in rows if item[2][key] not in known]:
+                        reject(item[0], item[1], "Unknown %s %s" % (key, item[2][key]))
+                        rows.remove(item)
+                if target.conflicts is not None and rows:
+                    found = target.conflicts(conn, [row for _, _, row, _ in rows])
+                    for position in sorted(found):
+                        reject(rows[position][0], rows[position][1], found[position])
+                    rows = [item for position, item in enumerate(rows) if position not in found]
+                write_rows(conn, table, [row for _, _, row, _ in rows])
+                if target.genre_table is not None:
+                    genres = [{target.genre_key: genre, target.fk_key: row['id']}
+                              for _, _, row, row_genres in rows for genre in row_genres]
+                    write_rows(conn, target.genre_table, genres)
+                if after_batch is not None:
+                    after_batch(conn, [row for _, _, row, _ in rows])
+            imported += len(rows)
+            checkpoint.imported += len(rows)
+            checkpoint.offset = batch[-1][0] + 1
+            checkpoint.save()
+            elapsed = time.perf_counter() - start
+            echo("%s: %d imported, %d rejected, %.0f rows/s" % (
+                table.name, checkpoint.imported, checkpoint.rejected, imported / elapsed if elapsed else 0))
+    finally:
+        if rejects is not None:
+            rejects.close()
+    checkpoint.remove()
+    return checkpoint
@@ -0,0 +1,181 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# ----------------------------------------------------------------------------#
+# Connection pool settings and database telemetry.
+#
+# pool_options() turns the DB_POOL_* settings of config.py into engine
+# options. Metrics listens to the engine's pool and cursor events and counts
+# checkouts, checkout waits, connections in use and, per view, the number of
+# queries and their time. render() writes them in the Prometheus text format
+# served at /metrics.
+# ----------------------------------------------------------------------------#
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that reports how long each connect() waited for a connection.
+    on_wait = None
+
+    def connect(self):
+        start = time.perf_counter()
+        conn = super(TimedQueuePool, self).connect()
+        if self.on_wait is not None:
+            self.on_wait(time.perf_counter() - start)
+        return conn
+
+    def recreate(self):
+        pool = super(TimedQueuePool, self).recreate()
+        pool.on_wait = self.on_wait
+        return pool
+
+
+def pool_options(config, backend):
+    # SQLite is left to Flask-SQLAlchemy, which picks its own pool for it.
+    if backend == 'sqlite':
+        return {}
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_POOL_OVERFLOW', 10),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', -1),
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+    }
+    if backend == 'postgresql' and config.get('DB_STATEMENT_TIMEOUT'):
+        options['connect_args'] = {'options': '-c statement_timeout=%d' % config['DB_STATEMENT_TIMEOUT']}
+    return options
+
+
+def labels(**values):
+    return '{%s}' % ",".join('%s="%s"' % (k, v.replace('\\', '\\\\').replace('"', '\\"'))
+                             for k, v in sorted(values.items()))
+
+
+class Histogram(object):
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def lines(self, name, **label_values):
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            yield '%s_bucket%s %d' % (name, labels(le=repr(bound), **label_values), cumulative)
+        yield '%s_bucket%s %d' % (name, labels(le='+Inf', **label_values), self.count)
+        suffix = labels(**label_values) if label_values else ''
+        yield '%s_sum%s %.6f' % (name, suffix, self.sum)
+        yield '%s_count%s %d' % (name, suffix, self.count)
+
+
+class Metrics(object):
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.engine = None
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def reset(self):
+        with self.lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.connects = 0
+            self.checkout_wait = Histogram()
+            self.view_requests = defaultdict(int)
+            self.view_queries = defaultdict(int)
+            self.view_query_time = defaultdict(Histogram)
+
+    def init_app(self, app):
+        @app.teardown_request
+        def count_view_request(exc):
+            with self.lock:
+                self.view_requests[request.endpoint or 'none'] += 1
+
+    def watch(self, engine):
+        # Called for every engine the app creates; the latest one is reported.
+        self.engine = engine
+        if isinstance(engine.pool, TimedQueuePool):
+            engine.pool.on_wait = self.observe_wait
+        event.listen(engine, 'connect', self.on_connect)
+        event.listen(engine, 'checkout', self.on_checkout)
+        event.listen(engine, 'checkin', self.on_checkin)
+        event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+        return engine
+
+    def observe_wait(self, seconds):
+        with self.lock:
+            self.checkout_wait.observe(seconds)
+
+    def on_connect(self, dbapi_conn, record):
+        with self.lock:
+            self.connects += 1
+
+    def on_checkout(self, dbapi_conn, record, proxy):
+        with self.lock:
+            self.checkouts += 1
+
+    def on_checkin(self, dbapi_conn, record):
+        with self.lock:
+            self.checkins += 1
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        view = (request.endpoint or 'none') if has_request_context() else 'none'
+        with self.lock:
+            self.view_queries[view] += 1
+            self.view_query_time[view].observe(elapsed)
+
+    def render(self):
+        out = []
+
+        def metric(name, kind, help, samples):
+            out.append('# HELP %s %s' % (name, help))
+            out.append('# TYPE %s %s' % (name, kind))
+            out.extend(samples)
+
+        with self.lock:
+            metric('fyyur_db_pool_checkouts_total', 'counter', 'Connections checked out of the pool.',
+                   ['fyyur_db_pool_checkouts_total %d' % self.checkouts])
+            metric('fyyur_db_pool_connects_total', 'counter', 'New database connections opened.',
+                   ['fyyur_db_pool_connects_total %d' % self.connects])
+            metric('fyyur_db_pool_active_connections', 'gauge', 'Connections currently checked out.',
+                   ['fyyur_db_pool_active_connections %d' % (self.checkouts - self.checkins)])
+            pool = self.engine.pool if self.engine is not None else None
+            if isinstance(pool, QueuePool):
+                metric('fyyur_db_pool_size', 'gauge', 'Configured pool size.',
+                       ['fyyur_db_pool_size %d' % pool.size()])
+                metric('fyyur_db_pool_overflow', 'gauge', 'Connections open beyond the pool size.',
+                       ['fyyur_db_pool_overflow %d' % max(pool.overflow(), 0)])
+            metric('fyyur_db_pool_checkout_wait_seconds', 'histogram', 'Time spent waiting for a connection.',
+                   list(self.checkout_wait.lines('fyyur_db_pool_checkout_wait_seconds')))
+            metric('fyyur_view_requests_total', 'counter', 'Requests handled per view.',
+                   ['fyyur_view_requests_total%s %d' % (labels(view=v), n)
+                    for v, n in sorted(self.view_requests.items())])
+            metric('fyyur_view_queries_total', 'counter', 'SQL statements executed per view.',
+                   ['fyyur_view_queries_total%s %d' % (labels(view=v), n)
+                    for v, n in sorted(self.view_queries.items())])
+            metric('fyyur_view_query_seconds', 'histogram', 'SQL statement time per view.',
+                   [line for v, h in sorted(self.view_query_time.items())
+                    for line in h.lines('fyyur_view_query_seconds', view=v)])
+        return "\n".join(out) + "\n"
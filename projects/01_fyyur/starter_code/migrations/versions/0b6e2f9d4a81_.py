@@ -0,0 +1,37 @@
+"""show duration and booking exclusion constraints
+
+Revision ID: 0b6e2f9d4a81
+Revises: f3c81d0a6b27
+Create Date: 2026-10-18 17:05:42.118530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b6e2f9d4a81'
+down_revision = 'f3c81d0a6b27'
+branch_labels = None
+depends_on = None
+
+# start_time is a timestamp without time zone, so the ranges are tsrange
+# (an immutable expression, as an exclusion constraint needs).
+BOOKED = "tsrange(start_time, start_time + duration * interval '1 minute')"
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('duration', sa.Integer(), server_default='120', nullable=False))
+    # btree_gist lets the GiST index compare the integer ids with =
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    # fails if existing shows already overlap; resolve those first
+    op.execute('ALTER TABLE "Show" ADD CONSTRAINT "Show_venue_booking_excl" '
+               'EXCLUDE USING gist (vid WITH =, %s WITH &&)' % BOOKED)
+    op.execute('ALTER TABLE "Show" ADD CONSTRAINT "Show_artist_booking_excl" '
+               'EXCLUDE USING gist (aid WITH =, %s WITH &&)' % BOOKED)
+
+
+def downgrade():
+    op.execute('ALTER TABLE "Show" DROP CONSTRAINT "Show_artist_booking_excl"')
+    op.execute('ALTER TABLE "Show" DROP CONSTRAINT "Show_venue_booking_excl"')
+    op.drop_column('Show', 'duration')
@@ -0,0 +1,25 @@
+"""show start time index for calendar range queries
+
+Revision ID: 1d4f7c2e9a05
+Revises: 0b6e2f9d4a81
+Create Date: 2026-10-18 17:52:30.664019
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1d4f7c2e9a05'
+down_revision = '0b6e2f9d4a81'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # /shows/calendar scans a start_time range across all venues
+    op.create_index('ix_Show_start_time', 'Show', ['start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_start_time', table_name='Show')
@@ -0,0 +1,31 @@
+"""show counters are deleted with their venue or artist
+
+Revision ID: b7d2e6f1c390
+Revises: 1d4f7c2e9a05
+Create Date: 2026-10-18 19:05:41.338112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e6f1c390'
+down_revision = '1d4f7c2e9a05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a venue or artist whose shows are gone keeps a zeroed counter row
+    op.drop_constraint('VenueShowCounts_vid_fkey', 'VenueShowCounts', type_='foreignkey')
+    op.create_foreign_key('VenueShowCounts_vid_fkey', 'VenueShowCounts', 'Venue', ['vid'], ['id'], ondelete='CASCADE')
+    op.drop_constraint('ArtistShowCounts_aid_fkey', 'ArtistShowCounts', type_='foreignkey')
+    op.create_foreign_key('ArtistShowCounts_aid_fkey', 'ArtistShowCounts', 'Artist', ['aid'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    op.drop_constraint('ArtistShowCounts_aid_fkey', 'ArtistShowCounts', type_='foreignkey')
+    op.create_foreign_key('ArtistShowCounts_aid_fkey', 'ArtistShowCounts', 'Artist', ['aid'], ['id'])
+    op.drop_constraint('VenueShowCounts_vid_fkey', 'VenueShowCounts', type_='foreignkey')
+    op.create_foreign_key('VenueShowCounts_vid_fkey', 'VenueShowCounts', 'Venue', ['vid'], ['id'])
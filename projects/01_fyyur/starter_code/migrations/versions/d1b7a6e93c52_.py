@@ -0,0 +1,33 @@
+"""show, genre foreign key and venue area indexes
+
+Revision ID: d1b7a6e93c52
+Revises: c4e8d2b1f7a3
+Create Date: 2026-10-18 11:03:47.918254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1b7a6e93c52'
+down_revision = 'c4e8d2b1f7a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_vid_start_time', 'Show', ['vid', 'start_time'], unique=False)
+    op.create_index('ix_Show_aid_start_time', 'Show', ['aid', 'start_time'], unique=False)
+    op.create_index('ix_Venue_city_state', 'Venue', ['city', 'state'], unique=False)
+    # genre tables are keyed on (genre, id), which does not serve lookups by id
+    op.create_index(op.f('ix_VGenres_vid'), 'VGenres', ['vid'], unique=False)
+    op.create_index(op.f('ix_AGenres_aid'), 'AGenres', ['aid'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_AGenres_aid'), table_name='AGenres')
+    op.drop_index(op.f('ix_VGenres_vid'), table_name='VGenres')
+    op.drop_index('ix_Venue_city_state', table_name='Venue')
+    op.drop_index('ix_Show_aid_start_time', table_name='Show')
+    op.drop_index('ix_Show_vid_start_time', table_name='Show')
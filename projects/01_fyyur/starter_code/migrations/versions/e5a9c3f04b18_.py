@@ -0,0 +1,54 @@
+"""venue and artist show counters
+
+Revision ID: e5a9c3f04b18
+Revises: d1b7a6e93c52
+Create Date: 2026-10-18 11:48:09.215730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a9c3f04b18'
+down_revision = 'd1b7a6e93c52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('VenueShowCounts',
+    sa.Column('vid', sa.Integer(), nullable=False),
+    sa.Column('upcoming_shows', sa.Integer(), nullable=False),
+    sa.Column('past_shows', sa.Integer(), nullable=False),
+    sa.Column('next_show', sa.TIMESTAMP(), nullable=True),
+    sa.ForeignKeyConstraint(['vid'], ['Venue.id'], ),
+    sa.PrimaryKeyConstraint('vid')
+    )
+    op.create_index(op.f('ix_VenueShowCounts_next_show'), 'VenueShowCounts', ['next_show'], unique=False)
+    op.create_table('ArtistShowCounts',
+    sa.Column('aid', sa.Integer(), nullable=False),
+    sa.Column('upcoming_shows', sa.Integer(), nullable=False),
+    sa.Column('past_shows', sa.Integer(), nullable=False),
+    sa.Column('next_show', sa.TIMESTAMP(), nullable=True),
+    sa.ForeignKeyConstraint(['aid'], ['Artist.id'], ),
+    sa.PrimaryKeyConstraint('aid')
+    )
+    op.create_index(op.f('ix_ArtistShowCounts_next_show'), 'ArtistShowCounts', ['next_show'], unique=False)
+    # initial fill; afterwards `flask refresh-show-counts` rebuilds them
+    for table, key in (('VenueShowCounts', 'vid'), ('ArtistShowCounts', 'aid')):
+        op.execute(
+            'INSERT INTO "{0}" ({1}, upcoming_shows, past_shows, next_show) '
+            'SELECT {1}, '
+            'SUM(CASE WHEN start_time > LOCALTIMESTAMP THEN 1 ELSE 0 END), '
+            'SUM(CASE WHEN start_time > LOCALTIMESTAMP THEN 0 ELSE 1 END), '
+            'MIN(CASE WHEN start_time > LOCALTIMESTAMP THEN start_time END) '
+            'FROM "Show" GROUP BY {1}'.format(table, key)
+        )
+
+
+def downgrade():
+    op.drop_index(op.f('ix_ArtistShowCounts_next_show'), table_name='ArtistShowCounts')
+    op.drop_table('ArtistShowCounts')
+    op.drop_index(op.f('ix_VenueShowCounts_next_show'), table_name='VenueShowCounts')
+    op.drop_table('VenueShowCounts')
@@ -0,0 +1,25 @@
+"""artist name index for the directory
+
+Revision ID: f3c81d0a6b27
+Revises: e5a9c3f04b18
+Create Date: 2026-10-18 16:20:11.402877
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c81d0a6b27'
+down_revision = 'e5a9c3f04b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # /artists pages by keyset on (name, id); the trigram index does not order
+    op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Artist_name_id', table_name='Artist')
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+# ----------------------------------------------------------------------------#
+# Keyset pagination on (start_time, id) or (name, id).
+#
+# A page is "the next `limit` rows after the last one seen", so the database
+# walks an index from the cursor instead of counting past an OFFSET, and the
+# cost of a page does not depend on how deep it is.
+# ----------------------------------------------------------------------------#
+
+CURSOR_SEPARATOR = '_'
+
+
+def encode_cursor(start_time, id):
+    return start_time.isoformat() + CURSOR_SEPARATOR + str(id)
+
+
+def decode_cursor(cursor):
+    # Raises ValueError on a malformed cursor.
+    start_time, _, id = cursor.rpartition(CURSOR_SEPARATOR)
+    return datetime.fromisoformat(start_time), int(id)
+
+
+def encode_name_cursor(name, id):
+    return name + CURSOR_SEPARATOR + str(id)
+
+
+def decode_name_cursor(cursor):
+    # Names may contain the separator; the id after the last one never does.
+    name, separator, id = cursor.rpartition(CURSOR_SEPARATOR)
+    if not separator:
+        raise ValueError("Malformed cursor %r" % cursor)
+    return name, int(id)
+
+
+def after(column, id_column, cursor):
+    value, id = cursor
+    return or_(column > value, and_(column == value, id_column > id))
+
+
+def page(rows, limit, key, encode=encode_cursor):
+    # `rows` was fetched with limit + 1 so a next page can be detected without
+    # a COUNT query.
+    rows = list(rows)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode(*key(rows[-1])) if has_more else None
+    return rows, next_cursor
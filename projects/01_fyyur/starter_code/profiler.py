@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import OrderedDict
+
+from flask import g, request
+from sqlalchemy import event
+
+# ----------------------------------------------------------------------------#
+# Per-request SQL profiling.
+#
+# When SQL_PROFILE is on, a sample of requests (SQL_PROFILE_SAMPLE_RATE) has
+# every statement recorded with its time and the line of app code that ran
+# it. Statements are grouped by shape (the SQL with literals and IN lists
+# folded), and a shape run SQL_PROFILE_REPEAT times or more in one request is
+# reported as an N+1. The response gets a Server-Timing header and the
+# request one JSON log line on the 'fyyur.sql' logger. Parameters are never
+# logged, only statement shapes.
+# ----------------------------------------------------------------------------#
+
+logger = logging.getLogger('fyyur.sql')
+
+SHAPE_RULES = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%\(\w+\)s|\$\d+|:\w+'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def statement_shape(statement):
+    for pattern, replacement in SHAPE_RULES:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def call_site(root):
+    # Innermost frame of app code under `root`, outside libraries and this module.
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(root) and filename != __file__ and 'site-packages' not in filename:
+            return '%s:%d %s' % (os.path.relpath(filename, root), frame.f_lineno, frame.f_code.co_name)
+        frame = frame.f_back
+    return None
+
+
+class SQLProfiler(object):
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+    def start(self):
+        config = self.app.config
+        if config.get('SQL_PROFILE') and random.random() < config.get('SQL_PROFILE_SAMPLE_RATE', 1.0):
+            g.sql_profile = []
+            g.sql_profile_start = time.perf_counter()
+
+    def watch(self, engine):
+        event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+        return engine
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if g and g.get('sql_profile') is not None:
+            conn.info.setdefault('profile_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if g and g.get('sql_profile') is not None and conn.info.get('profile_start'):
+            elapsed = time.perf_counter() - conn.info['profile_start'].pop()
+            g.sql_profile.append((statement_shape(statement), elapsed, call_site(self.app.root_path)))
+
+    def summary(self, statements):
+        # {shape: [count, seconds, call sites]} in first-run order
+        shapes = OrderedDict()
+        for shape, elapsed, site in statements:
+            entry = shapes.setdefault(shape, [0, 0.0, []])
+            entry[0] += 1
+            entry[1] += elapsed
+            if site is not None and site not in entry[2]:
+                entry[2].append(site)
+        return shapes
+
+    def finish(self, response):
+        statements = g.pop('sql_profile', None)
+        if statements is None:
+            return response
+        total = time.perf_counter() - g.pop('sql_profile_start')
+        db_time = sum(elapsed for _, elapsed, _ in statements)
+        shapes = self.summary(statements)
+        repeat = self.app.config.get('SQL_PROFILE_REPEAT', 3)
+        repeated = [(shape, entry) for shape, entry in shapes.items() if entry[0] >= repeat]
+
+        timing = ['db;dur=%.2f;desc="%d queries"' % (db_time * 1000, len(statements)),
+                  'app;dur=%.2f' % (total * 1000)]
+        if repeated:
+            timing.append('n1;desc="%d repeated statements"' % len(repeated))
+        response.headers.add('Server-Timing', ", ".join(timing))
+
+        logger.info(json.dumps({
+            'event': 'sql_profile',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(total * 1000, 2),
+            'db_ms': round(db_time * 1000, 2),
+            'queries': len(statements),
+            'n_plus_one': [{'statement': shape, 'count': entry[0], 'call_sites': entry[2]}
+                           for shape, entry in repeated],
+            'statements': [{'statement': shape, 'count': entry[0], 'ms': round(entry[1] * 1000, 2),
+                            'call_sites': entry[2]} for shape, entry in shapes.items()],
+        }))
+        return response
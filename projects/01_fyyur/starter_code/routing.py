@@ -0,0 +1,59 @@
+import time
+
+from flask import g, has_app_context, request, session
+from flask_sqlalchemy import SignallingSession, get_state
+from sqlalchemy.sql.dml import UpdateBase
+
+# ----------------------------------------------------------------------------#
+# Read-replica routing.
+#
+# With a 'replica' entry in SQLALCHEMY_BINDS, GET requests and the search
+# POSTs read from the replica; everything else, and any flush or INSERT/
+# UPDATE/DELETE, goes to the primary. Once a request has written, the rest of
+# it and the same browser's requests for REPLICA_STICKY_SECONDS read from the
+# primary too, so users see their own writes while the replica catches up.
+# ----------------------------------------------------------------------------#
+
+REPLICA = 'replica'
+
+
+def replica_configured(app):
+    return REPLICA in (app.config.get('SQLALCHEMY_BINDS') or {})
+
+
+def reads_from_replica():
+    return has_app_context() and g.get('db_replica', False) and not g.get('db_wrote', False)
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        writing = self._flushing or isinstance(clause, UpdateBase)
+        if writing and has_app_context():
+            g.db_wrote = True
+        if not writing and reads_from_replica():
+            return get_state(self.app).db.get_engine(self.app, bind=REPLICA)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class ReplicaRouter(object):
+    def __init__(self, app=None, read_endpoints=()):
+        # POST endpoints that only read, e.g. the search forms
+        self.read_endpoints = set(read_endpoints)
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.before_request(self.route)
+        app.after_request(self.stick)
+
+    def route(self):
+        g.db_replica = (replica_configured(self.app)
+                        and (request.method in ('GET', 'HEAD') or request.endpoint in self.read_endpoints)
+                        and session.get('primary_until', 0) < time.time())
+
+    def stick(self, response):
+        if g.get('db_wrote') and replica_configured(self.app):
+            session['primary_until'] = time.time() + self.app.config.get('REPLICA_STICKY_SECONDS', 5)
+        return response
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import defaultdict
+
+import cache
+
+# ----------------------------------------------------------------------------#
+# Name search for venues and artists.
+#
+# On PostgreSQL `name ILIKE '%term%'` is served by a pg_trgm GIN index (see the
+# trigram migration). Elsewhere (SQLite, tests) an in-process n-gram index maps
+# each trigram to the ids whose name contains it, so a search intersects a few
+# posting sets instead of scanning the table. A built index is dropped once a
+# session that wrote its table commits, and rebuilt after INDEX_TTL seconds
+# for writes made by other processes.
+# ----------------------------------------------------------------------------#
+
+N = 3
+INDEX_TTL = 300
+LIKE_ESCAPE = '\\'
+
+
+def escape_like(term):
+    # The search term is a literal string, never a LIKE pattern.
+    return term.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2).replace('%', LIKE_ESCAPE + '%').replace('_', LIKE_ESCAPE + '_')
+
+
+def ngrams(text, n=N):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class NgramIndex(object):
+    def __init__(self, n=N):
+        self.n = n
+        self.postings = defaultdict(set)
+        self.names = {}
+
+    def add(self, id, name):
+        self.discard(id)
+        name = (name or '').lower()
+        self.names[id] = name
+        for gram in ngrams(name, self.n):
+            self.postings[gram].add(id)
+
+    def discard(self, id):
+        name = self.names.pop(id, None)
+        if name is None:
+            return
+        for gram in ngrams(name, self.n):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.discard(id)
+                if not posting:
+                    del self.postings[gram]
+
+    def search(self, term):
+        term = (term or '').lower()
+        if len(term) < self.n:
+            # Too short to have a trigram: fall back to a scan of the names.
+            return [id for id, name in self.names.items() if term in name]
+        postings = sorted((self.postings.get(gram, ()) for gram in ngrams(term, self.n)), key=len)
+        if not postings[0]:
+            return []
+        candidates = set(postings[0]).intersection(*postings[1:])
+        # Sharing every trigram does not imply containing the term, so verify.
+        return [id for id in candidates if term in self.names[id]]
+
+    def __len__(self):
+        return len(self.names)
+
+
+class TrigramSearch(object):
+    name = 'trigram'
+
+    def criterion(self, session, model, term):
+        return model.name.ilike('%' + escape_like(term) + '%', escape=LIKE_ESCAPE)
+
+
+class NgramSearch(object):
+    name = 'ngram'
+
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self.indexes = {}  # model -> (version, built at, index)
+        self.versions = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def _fresh(self, model, built):
+        return built is not None and built[0] == self.versions[model] and time.time() - built[1] < self.ttl
+
+    def index(self, session, model):
+        built = self.indexes.get(model)
+        if not self._fresh(model, built):
+            with self.lock:
+                # another thread may have rebuilt while this one waited
+                built = self.indexes.get(model)
+                if not self._fresh(model, built):
+                    version = self.versions[model]
+                    index = NgramIndex()
+                    for id, name in session.query(model.id, model.name):
+                        index.add(id, name)
+                    built = self.indexes[model] = (version, time.time(), index)
+        return built[2]
+
+    def criterion(self, session, model, term):
+        return model.id.in_(self.index(session, model).search(term))
+
+    def reset(self, model=None):
+        # Drop the cached index(es); they are rebuilt on the next search. The
+        # version bump also drops an index being built from older rows.
+        for model in ([model] if model is not None else list(self.versions)):
+            self.versions[model] += 1
+            self.indexes.pop(model, None)
+
+    def watch(self, model):
+        # Rebuild after committed ORM writes; rolled back writes never reach
+        # the index. Rows written through Core (bulk imports) must call reset().
+        cache.invalidate_on_commit(model, lambda: self.reset(model))
+
+
+BACKENDS = {
+    'trigram': TrigramSearch,
+    'ngram': NgramSearch,
+}
+
+
+class Search(object):
+    def __init__(self, backend=None):
+        # backend: 'trigram', 'ngram' or None to pick by database dialect.
+        self.backend_name = backend
+        self.backends = dict((name, cls()) for name, cls in BACKENDS.items())
+
+    def backend(self, session):
+        name = self.backend_name
+        if name is None:
+            name = 'trigram' if session.bind.dialect.name == 'postgresql' else 'ngram'
+        return self.backends[name]
+
+    def criterion(self, session, model, term):
+        return self.backend(session).criterion(session, model, term)
+
+    def watch(self, *models):
+        for model in models:
+            self.backends['ngram'].watch(model)
+
+    def reset(self, model=None):
+        self.backends['ngram'].reset(model)
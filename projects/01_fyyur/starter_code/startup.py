@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+# ----------------------------------------------------------------------------#
+# Cold-start helpers: a filesystem bytecode cache for compiled templates, a
+# warm-up that loads every template at boot, and `flask startup-report`.
+# ----------------------------------------------------------------------------#
+
+TEMPLATE_DIRS = ('pages/', 'forms/', 'layouts/', 'errors/')
+
+
+def use_bytecode_cache(env, directory=None):
+    # directory=None uses Jinja's per-user temp directory.
+    if directory is not None and not os.path.isdir(directory):
+        os.makedirs(directory)
+    env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def app_templates(env):
+    return sorted(name for name in env.list_templates(extensions=['html']) if name.startswith(TEMPLATE_DIRS))
+
+
+def warm_templates(env):
+    # Load (and compile, unless the bytecode cache has them) every template.
+    start = time.perf_counter()
+    names = app_templates(env)
+    for name in names:
+        env.get_template(name)
+    return len(names), (time.perf_counter() - start) * 1000
+
+
+def template_compile_times(env):
+    # Source -> code object for each template, bypassing every cache.
+    times = []
+    for name in app_templates(env):
+        source, filename, _ = env.loader.get_source(env, name)
+        start = time.perf_counter()
+        env.compile(source, name, filename)
+        times.append((name, (time.perf_counter() - start) * 1000))
+    return times
+
+
+def import_times(modules, cwd):
+    # Import `modules` in a fresh interpreter with -X importtime and return
+    # {module: (self ms, cumulative ms)}.
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', '; '.join('import ' + m for m in modules)],
+        cwd=cwd, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, universal_newlines=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        if name in modules and self_us.isdigit():
+            times[name] = (int(self_us) / 1000.0, int(cumulative_us) / 1000.0)
+    return times
@@ -0,0 +1,674 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import event
+
+import async_api
+import booking
+import metrics
+import profiler
+import search as fyyur_search
+import validation
+
+import app as fyyur
+from app import app, db, db_metrics, name_search, page_cache, Venue, Artist, Show, VGenres, AGenres, VenueShowCounts, \
+    ArtistShowCounts, roll_over_show_counts
+
+
+class QueryCounter(object):
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the Fyyur test case"""
+
+    def setUp(self):
+        """Point the app at an in-memory SQLite database and seed it."""
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client
+        name_search.reset()
+        page_cache.clear()
+        with app.app_context():
+            db.drop_all()
+            self.seed()
+
+    def seed(self):
+        now = datetime.today()
+        with app.app_context():
+            db.create_all()
+            db.session.add_all([
+                Venue(id=1, name="The Musical Hop", city="San Francisco", state="CA"),
+                Venue(id=2, name="Park Square Live Music & Coffee", city="San Francisco", state="CA"),
+                Venue(id=3, name="The Dueling Pianos Bar", city="New York", state="NY"),
+                Artist(id=1, name="Guns N Petals", city="San Francisco", state="CA"),
+                Artist(id=2, name="Matt Quevedo", city="New York", state="NY"),
+            ])
+            db.session.flush()
+            db.session.add_all([
+                VGenres(genre="Jazz", vid=1),
+                VGenres(genre="Folk", vid=1),
+                AGenres(agenre="RocknRoll", aid=1),
+                Show(vid=1, aid=1, start_time=now - timedelta(days=30)),
+                Show(vid=1, aid=2, start_time=now + timedelta(days=30)),
+                Show(vid=1, aid=1, start_time=now + timedelta(days=60)),
+                Show(vid=3, aid=2, start_time=now + timedelta(days=1)),
+            ])
+            db.session.commit()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    @contextmanager
+    def count_queries(self):
+        with app.app_context():
+            engine = db.engine
+        counter = QueryCounter()
+        event.listen(engine, 'before_cursor_execute', counter)
+        try:
+            yield counter
+        finally:
+            event.remove(engine, 'before_cursor_execute', counter)
+
+    def test_venues_grouped_by_area_in_one_query(self):
+        with self.count_queries() as queries:
+            res = self.client().get('/venues')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(queries.count, 1)
+        body = res.get_data(as_text=True)
+        self.assertEqual(body.count("San Francisco, CA"), 1)
+        self.assertIn("The Dueling Pianos Bar", body)
+
+    def test_show_venue_within_round_trip_budget(self):
+        with self.count_queries() as queries:
+            res = self.client().get('/venues/1')
+        self.assertEqual(res.status_code, 200)
+        self.assertLessEqual(queries.count, 2)
+        body = res.get_data(as_text=True)
+        self.assertIn("2 Upcoming Shows", body)
+        self.assertIn("1 Past Show", body)
+        self.assertIn("Jazz", body)
+
+    def test_show_artist_within_round_trip_budget(self):
+        with self.count_queries() as queries:
+            res = self.client().get('/artists/2')
+        self.assertEqual(res.status_code, 200)
+        self.assertLessEqual(queries.count, 2)
+        body = res.get_data(as_text=True)
+        self.assertIn("2 Upcoming Shows", body)
+        self.assertIn("The Dueling Pianos Bar", body)
+
+    def test_search_venues_partial_case_insensitive(self):
+        with self.count_queries() as queries:
+            res = self.client().post('/venues/search', data={'search_term': 'MUSIC'})
+        self.assertEqual(res.status_code, 200)
+        body = res.get_data(as_text=True)
+        self.assertIn("The Musical Hop", body)
+        self.assertIn("Park Square Live Music &amp; Coffee", body)
+        self.assertNotIn("The Dueling Pianos Bar", body)
+        # index build, the search query
+        self.assertLessEqual(queries.count, 2)
+
+    def test_search_term_is_literal(self):
+        for backend in ('ngram', 'trigram'):
+            name_search.backend_name = backend
+            try:
+                res = self.client().post('/artists/search', data={'search_term': '%'})
+            finally:
+                name_search.backend_name = None
+            self.assertNotIn("Guns N Petals", res.get_data(as_text=True))
+
+    def test_search_index_follows_writes(self):
+        self.client().post('/artists/search', data={'search_term': 'petals'})
+        with app.app_context():
+            db.session.add(Artist(id=3, name="The Wild Sax Band", city="San Francisco", state="CA"))
+            db.session.commit()
+        res = self.client().post('/artists/search', data={'search_term': 'sax'})
+        self.assertIn("The Wild Sax Band", res.get_data(as_text=True))
+
+    def test_search_index_ignores_rolled_back_writes(self):
+        self.client().post('/artists/search', data={'search_term': 'petals'})
+        with app.app_context():
+            Artist.query.get(1).name = "Guns N Zzz"
+            db.session.flush()
+            db.session.rollback()
+        res = self.client().post('/artists/search', data={'search_term': 'petals'})
+        self.assertIn("Guns N Petals", res.get_data(as_text=True))
+        res = self.client().post('/artists/search', data={'search_term': 'zzz'})
+        self.assertNotIn("Guns N Petals", res.get_data(as_text=True))
+
+    def test_search_index_rebuilt_after_ttl(self):
+        backend = name_search.backends['ngram']
+        with mock.patch.object(fyyur_search.time, 'time', return_value=1000):
+            self.client().post('/artists/search', data={'search_term': 'petals'})
+        # a write the ORM events do not see, as from another process
+        with app.app_context():
+            db.session.execute(Artist.__table__.insert().values(id=3, name="The Wild Sax Band"))
+            db.session.commit()
+        with mock.patch.object(fyyur_search.time, 'time', return_value=1000 + backend.ttl - 1):
+            res = self.client().post('/artists/search', data={'search_term': 'sax'})
+            self.assertNotIn("The Wild Sax Band", res.get_data(as_text=True))
+        with mock.patch.object(fyyur_search.time, 'time', return_value=1000 + backend.ttl):
+            res = self.client().post('/artists/search', data={'search_term': 'sax'})
+            self.assertIn("The Wild Sax Band", res.get_data(as_text=True))
+
+    def test_search_shows_pages_by_cursor(self):
+        with mock.patch.object(fyyur, 'SEARCH_PAGE_SIZE', 1):
+            res = self.client().post('/shows/search', data={'search_term': 'hop'})
+            body = res.get_data(as_text=True)
+            self.assertIn('name="after"', body)
+            cursor = body.split('name="after" value="')[1].split('"')[0]
+            res = self.client().post('/shows/search', data={'search_term': 'hop', 'after': cursor})
+            self.assertIn("Matt Quevedo", res.get_data(as_text=True))
+
+    def test_search_shows_term_is_literal(self):
+        res = self.client().post('/shows/search', data={'search_term': '.*'})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('results for ".*": 0', res.get_data(as_text=True))
+
+    def test_shows_filtered_and_paged(self):
+        with mock.patch.object(fyyur, 'SHOWS_PAGE_SIZE', 2):
+            res = self.client().get('/shows?venue_id=1')
+            body = res.get_data(as_text=True)
+            self.assertEqual(body.count("playing at"), 2)
+            self.assertIn("Next page", body)
+            next_page = body.split('href="/shows?')[1].split('"')[0].replace('&amp;', '&')
+            res = self.client().get('/shows?' + next_page)
+            body = res.get_data(as_text=True)
+            self.assertEqual(body.count("playing at"), 1)
+            self.assertNotIn("Next page", body)
+            self.assertNotIn("The Dueling Pianos Bar", body)
+
+    def test_shows_stream(self):
+        res = self.client().get('/shows?stream=1&start=' + datetime.today().isoformat())
+        self.assertTrue(res.is_streamed)
+        self.assertEqual(res.get_data(as_text=True).count("playing at"), 3)
+
+    def test_shows_bad_filter(self):
+        self.assertEqual(self.client().get('/shows?start=yesterday').status_code, 400)
+
+    def venue_show_start(self, venue_id):
+        with app.app_context():
+            return Show.query.filter_by(vid=venue_id).first().start_time
+
+    def test_create_show_rejects_booking_conflict(self):
+        start = self.venue_show_start(3) + timedelta(minutes=90)
+        res = self.client().post('/shows/create', data={
+            'venue_id': '3', 'artist_id': '1', 'start_time': start.strftime('%Y-%m-%d %H:%M:%S'), 'duration': '60'})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("Venue 3 is already booked at that time.", res.get_data(as_text=True))
+        # the seeded show runs the default 120 minutes (the form drops microseconds)
+        start = self.venue_show_start(3) + timedelta(minutes=121)
+        res = self.client().post('/shows/create', data={
+            'venue_id': '3', 'artist_id': '1', 'start_time': start.strftime('%Y-%m-%d %H:%M:%S')})
+        self.assertEqual(res.status_code, 302)
+        with app.app_context():
+            self.assertEqual(Show.query.filter_by(vid=3).count(), 2)
+
+    def test_bulk_schedule_reports_conflicts(self):
+        free = datetime.today() + timedelta(days=10)
+        booked = self.venue_show_start(3)
+        res = self.client().post('/shows/bulk', json=[
+            {'venue_id': 2, 'artist_id': 1, 'start_time': free.isoformat()},
+            {'venue_id': 2, 'artist_id': 2, 'start_time': (free + timedelta(hours=1)).isoformat()},
+            {'venue_id': 3, 'artist_id': 1, 'start_time': (booked + timedelta(hours=1)).isoformat(), 'duration': 30},
+            {'venue_id': 99, 'artist_id': 1, 'start_time': free.isoformat()},
+            {'venue_id': 2},
+            {'venue_id': 2, 'artist_id': 1, 'start_time': 5},
+            {'venue_id': 2, 'artist_id': 1, 'start_time': '2035-05-01T20:00:00Z'},
+        ])
+        self.assertEqual(res.status_code, 200)
+        data = res.get_json()
+        self.assertEqual(data['created'], 1)
+        self.assertEqual([c['index'] for c in data['conflicts']], [1, 2])
+        self.assertEqual(data['conflicts'][0]['conflicts'], [{'venue_id': 2, 'shows': [], 'requests': [0]}])
+        self.assertEqual(data['conflicts'][1]['conflicts'][0]['venue_id'], 3)
+        self.assertEqual(len(data['conflicts'][1]['conflicts'][0]['shows']), 1)
+        self.assertEqual([e['index'] for e in data['errors']], [3, 4, 5, 6])
+        self.assertEqual(data['errors'][2]['error'], "Invalid start_time 5")
+        self.assertEqual(data['errors'][3]['error'], "start_time must not carry a time zone")
+        with app.app_context():
+            self.assertEqual(VenueShowCounts.query.get(2).upcoming_shows, 1)
+        self.assertEqual(self.client().post('/shows/bulk', data='nope').status_code, 400)
+
+    def test_interval_set_keeps_touching_bookings_apart(self):
+        day = datetime(2030, 1, 1)
+        intervals = booking.IntervalSet()
+        intervals.add(day, day + timedelta(hours=2), 'a')
+        intervals.add(day + timedelta(hours=4), day + timedelta(hours=6), 'b')
+        self.assertEqual(intervals.overlapping(day + timedelta(hours=2), day + timedelta(hours=4)), [])
+        self.assertEqual(intervals.overlapping(day + timedelta(hours=1), day + timedelta(hours=5)), ['a', 'b'])
+        intervals.add(day + timedelta(hours=1), day + timedelta(hours=5), 'c')
+        self.assertEqual(intervals.starts, [day])
+        self.assertEqual(intervals.owners, [['a', 'b', 'c']])
+
+    def test_show_calendar_buckets_and_streams(self):
+        now = datetime.today()
+        query = '/shows/calendar?start=%s&end=%s' % ((now - timedelta(days=40)).date(), (now + timedelta(days=90)).date())
+        data = self.client().get(query + '&city=San+Francisco&state=CA').get_json()
+        self.assertEqual(data['total'], 3)
+        self.assertEqual([b['count'] for b in data['buckets']], [1, 1, 1])
+        self.assertEqual(data['buckets'][0]['start'], (now - timedelta(days=30)).date().isoformat())
+        data = self.client().get(query + '&bucket=week').get_json()
+        self.assertEqual(data['total'], 4)
+        self.assertTrue(all(datetime.fromisoformat(b['start']).weekday() == 0 for b in data['buckets']))
+        res = self.client().get(query + '&state=CA&format=ndjson')
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+        self.assertEqual([line['venue_id'] for line in lines], [1, 1, 1])
+        self.assertEqual(lines, sorted(lines, key=lambda line: line['start_time']))
+        self.assertEqual(self.client().get(query + '&bucket=month').status_code, 400)
+        self.assertEqual(self.client().get('/shows/calendar?start=2026-01-01').status_code, 400)
+
+    def test_show_counts_follow_show_writes(self):
+        with app.app_context():
+            counts = VenueShowCounts.query.get(1)
+            self.assertEqual((counts.upcoming_shows, counts.past_shows), (2, 1))
+            show = Show(vid=1, aid=2, start_time=datetime.today() + timedelta(days=5))
+            db.session.add(show)
+            db.session.commit()
+            self.assertEqual(VenueShowCounts.query.get(1).upcoming_shows, 3)
+            self.assertEqual(ArtistShowCounts.query.get(2).upcoming_shows, 3)
+            db.session.delete(show)
+            db.session.commit()
+            self.assertEqual(VenueShowCounts.query.get(1).upcoming_shows, 2)
+
+    def test_delete_venue_removes_its_zeroed_show_counts(self):
+        with app.app_context():
+            # PostgreSQL keeps a zeroed row once a venue's last show is deleted
+            db.session.add(VenueShowCounts(vid=2, upcoming_shows=0, past_shows=0))
+            db.session.commit()
+        self.client().delete('/venues/2')
+        with app.app_context():
+            self.assertIsNone(Venue.query.get(2))
+            self.assertIsNone(VenueShowCounts.query.get(2))
+
+    def test_stale_show_counts_are_counted_at_read_time(self):
+        # venue 1's next show has started since its counter row was written
+        with app.app_context():
+            counts = VenueShowCounts.query.get(1)
+            counts.upcoming_shows = 99
+            counts.next_show = datetime.today() - timedelta(minutes=1)
+            db.session.commit()
+        with app.app_context():
+            rows = dict((row.id, row.num_upcoming_shows) for row in fyyur.venue_area_rows(datetime.today()))
+            self.assertEqual(rows, {1: 2, 2: 0, 3: 1})
+            rows = fyyur.search_rows(Venue, 'vid', 'hop', datetime.today())
+            self.assertEqual([row.num_upcoming_shows for row in rows], [2])
+        # reads never write: the stored row is left for the refresh command
+        with self.count_queries() as queries:
+            self.assertEqual(self.client().get('/venues').status_code, 200)
+        self.assertTrue(all(q.startswith('SELECT') for q in queries.statements))
+        with app.app_context():
+            self.assertEqual(VenueShowCounts.query.get(1).upcoming_shows, 99)
+        app.test_cli_runner().invoke(args=['refresh-show-counts', '--due'])
+        with app.app_context():
+            self.assertEqual(VenueShowCounts.query.get(1).upcoming_shows, 2)
+
+    def test_show_counts_roll_over(self):
+        with app.app_context():
+            self.assertEqual(roll_over_show_counts('vid', datetime.today() + timedelta(days=45)), 2)
+            counts = VenueShowCounts.query.get(1)
+            self.assertEqual((counts.upcoming_shows, counts.past_shows), (1, 2))
+            counts = VenueShowCounts.query.get(3)
+            self.assertEqual((counts.upcoming_shows, counts.past_shows), (0, 1))
+
+    def test_refresh_show_counts_command(self):
+        with app.app_context():
+            VenueShowCounts.query.delete()
+            db.session.commit()
+        result = app.test_cli_runner().invoke(args=['refresh-show-counts'])
+        self.assertIn("2 venue and 2 artist counters rebuilt", result.output)
+
+    def test_cached_page_skips_database_and_honours_etag(self):
+        self.client().get('/venues/1')
+        with self.count_queries() as queries:
+            res = self.client().get('/venues/1')
+        self.assertEqual(queries.count, 0)
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNotNone(res.headers.get('ETag'))
+        res = self.client().get('/venues/1', headers={'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+
+    def test_writes_invalidate_tagged_pages(self):
+        self.client().get('/venues')
+        self.client().get('/artists/2')
+        self.client().get('/artists/1')
+        res = self.client().post('/venues/create', data={
+            'name': 'The Blue Note', 'city': 'New York', 'state': 'NY', 'address': '131 W 3rd St',
+            'phone': '212-475-8592', 'genres': ['Jazz'], 'facebook_link': 'https://www.facebook.com/bluenote',
+            'website': 'https://www.bluenotejazz.com', 'seeking_talent': 'NO', 'seeking_description': ''
+        })
+        self.assertEqual(res.status_code, 302)
+        # the first page after the write shows the flash message and is not cached
+        self.client().get('/')
+        self.assertIn("The Blue Note", self.client().get('/venues').get_data(as_text=True))
+        with app.app_context():
+            db.session.query(Venue).filter_by(id=3).update({'name': 'Renamed Bar'})
+            db.session.commit()
+        page_cache.invalidate('venue:3')
+        # artist 2 plays at venue 3, artist 1 does not
+        self.assertIn("Renamed Bar", self.client().get('/artists/2').get_data(as_text=True))
+        with self.count_queries() as queries:
+            self.client().get('/artists/1')
+        self.assertEqual(queries.count, 0)
+
+    def test_artists_directory_pages_by_name(self):
+        with mock.patch.object(fyyur, 'ARTISTS_PAGE_SIZE', 1):
+            body = self.client().get('/artists').get_data(as_text=True)
+            self.assertIn("Guns N Petals", body)
+            self.assertNotIn("Matt Quevedo", body)
+            self.assertIn('/artists?after=Guns+N+Petals_1', body)
+            body = self.client().get('/artists?after=Guns+N+Petals_1').get_data(as_text=True)
+            self.assertIn("Matt Quevedo", body)
+            self.assertNotIn("Next page", body)
+            self.assertIn("Matt Quevedo", self.client().get('/artists?from=M').get_data(as_text=True))
+            self.assertEqual(self.client().get('/artists?after=nocursor').status_code, 400)
+        with app.app_context():
+            self.assertEqual(fyyur.artist_jump_index(), [('G', 'G', 0, 1), ('M', 'M', 1, 1)])
+        # the jump index is cached, so a directory page is one query
+        page_cache.clear()
+        with self.count_queries() as queries:
+            self.client().get('/artists?from=G')
+        self.assertEqual(queries.count, 1)
+
+    def test_artist_jump_index_reloads_after_commit_or_ttl(self):
+        with app.app_context():
+            self.assertEqual([entry[0] for entry in fyyur.artist_jump_index()], ['G', 'M'])
+            version = fyyur.artist_jump_index.version
+            db.session.add(Artist(id=3, name="Zed", city="Austin", state="TX"))
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(fyyur.artist_jump_index.version, version)
+            db.session.add(Artist(id=4, name="Ana", city="Austin", state="TX"))
+            db.session.commit()
+            self.assertEqual(fyyur.artist_jump_index.version, version + 1)
+            self.assertEqual([entry[0] for entry in fyyur.artist_jump_index()], ['A', 'G', 'M'])
+            # a write from another process is picked up after the TTL
+            db.session.execute(Artist.__table__.insert(), {'id': 5, 'name': "Bo", 'city': "Austin", 'state': "TX"})
+            db.session.commit()
+            self.assertEqual(len(fyyur.artist_jump_index()), 3)
+            loaded = fyyur.artist_jump_index._state
+            fyyur.artist_jump_index._state = (loaded[0], loaded[1] - fyyur.ARTIST_INDEX_TTL, loaded[2])
+            self.assertEqual([entry[0] for entry in fyyur.artist_jump_index()], ['A', 'B', 'G', 'M'])
+
+    def artist_genres(self, artist_id):
+        with app.app_context():
+            return sorted(g.agenre.name for g in AGenres.query.filter_by(aid=artist_id))
+
+    def test_edit_artist_replaces_genres_in_bulk(self):
+        form = {
+            'city': 'San Francisco', 'state': 'CA', 'phone': '415-123-4567', 'genres': ['Jazz', 'Blues', 'RocknRoll'],
+            'facebook_link': 'https://www.facebook.com/gnp', 'website': 'https://gnp.example.com',
+            'seeking_venue': 'NO', 'seeking_description': ''
+        }
+        with self.count_queries() as queries:
+            res = self.client().post('/artists/1/edit', data=form)
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(self.artist_genres(1), ['Blues', 'Jazz', 'RocknRoll'])
+        genre_writes = [q for q in queries.statements if 'AGenres' in q and not q.startswith('SELECT')]
+        self.assertEqual(len(genre_writes), 1)
+
+        form['genres'] = ['Folk', 'Jazz']
+        with self.count_queries() as queries:
+            self.client().post('/artists/1/edit', data=form)
+        self.assertEqual(self.artist_genres(1), ['Folk', 'Jazz'])
+        genre_writes = [q for q in queries.statements if 'AGenres' in q and not q.startswith('SELECT')]
+        self.assertEqual(len(genre_writes), 2)
+
+    def write_file(self, name, content):
+        path = os.path.join(tempfile.mkdtemp(), name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_import_venues_csv(self):
+        path = self.write_file('venues.csv', "\n".join([
+            "name,city,state,address,phone,genres,seeking_talent,seeking_description",
+            "The Blue Note,New York,NY,131 W 3rd St,212-475-8592,Jazz;Blues,NO,",
+            "Bad Phone,New York,NY,1 Main St,999-475-8592,Jazz,NO,",
+            "Bad Genre,New York,NY,1 Main St,212-475-8592,Polka,NO,",
+        ]))
+        result = app.test_cli_runner().invoke(args=['import', 'venues', path])
+        self.assertIn("done: 1 imported, 2 rejected", result.output)
+        # the in-process page cache of other processes is out of reach
+        self.assertIn("note: running web workers keep their cached pages", result.output)
+        with app.app_context():
+            venue = Venue.query.filter_by(name="The Blue Note").one()
+            self.assertEqual(sorted(g.genre.name for g in venue.genres), ['Blues', 'Jazz'])
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def test_import_rejects_taken_ids_and_reserves_new_ones(self):
+        artist = {"city": "New York", "state": "NY", "phone": "212-475-8592", "genres": "Jazz"}
+        path = self.write_file('artists.ndjson', "\n".join(json.dumps(dict(artist, **record)) for record in [
+            {"id": 1, "name": "Taken Id"},
+            {"id": 10, "name": "Explicit Id"},
+            {"id": 10, "name": "Repeated Id"},
+            {"name": "New Id"},
+        ]))
+        result = app.test_cli_runner().invoke(args=['import', 'artists', path])
+        self.assertIn("done: 2 imported, 2 rejected", result.output)
+        with app.app_context():
+            self.assertEqual(Artist.query.get(1).name, "Guns N Petals")
+            self.assertEqual(Artist.query.get(10).name, "Explicit Id")
+            self.assertEqual(Artist.query.get(11).name, "New Id")
+
+    def test_import_shows_resumes_and_checks_references(self):
+        path = self.write_file('shows.ndjson', "\n".join(json.dumps(record) for record in [
+            {"venue_id": 2, "artist_id": 1, "start_time": "2035-01-01T20:00:00"},
+            {"venue_id": 2, "artist_id": 2, "start_time": "2035-01-02T20:00:00"},
+            {"venue_id": 99, "artist_id": 2, "start_time": "2035-01-03T20:00:00"},
+        ]))
+        with open(path + '.checkpoint', 'w') as f:
+            json.dump({"offset": 1, "imported": 1, "rejected": 0}, f)
+        result = app.test_cli_runner().invoke(args=['import', 'shows', path, '--resume'])
+        self.assertIn("done: 2 imported, 1 rejected", result.output)
+        with app.app_context():
+            self.assertEqual(Show.query.filter_by(vid=2).count(), 1)
+            self.assertEqual(VenueShowCounts.query.get(2).upcoming_shows, 1)
+
+    def test_import_shows_rejects_booking_conflicts(self):
+        booked = self.venue_show_start(3)
+        path = self.write_file('shows.ndjson', "\n".join(json.dumps(record) for record in [
+            {"venue_id": 2, "artist_id": 1, "start_time": "2035-01-01T20:00:00"},
+            {"venue_id": 2, "artist_id": 2, "start_time": "2035-01-01T21:00:00"},
+            {"venue_id": 3, "artist_id": 1, "start_time": (booked + timedelta(minutes=30)).isoformat()},
+            {"venue_id": 2, "artist_id": 2, "start_time": "2035-01-01T22:00:00"},
+        ]))
+        rejects = path + '.rejects'
+        result = app.test_cli_runner().invoke(args=['import', 'shows', path, '--rejects', rejects])
+        self.assertIn("done: 2 imported, 2 rejected", result.output)
+        with open(rejects) as f:
+            errors = [json.loads(line) for line in f]
+        self.assertEqual([(e['record'], e['error']) for e in errors], [
+            (1, "Venue 2 is already booked at that time."),
+            (2, "Venue 3 is already booked at that time."),
+        ])
+        with app.app_context():
+            self.assertEqual(Show.query.filter_by(vid=2).count(), 2)
+
+    def test_validate_many(self):
+        valid = {'state': 'NY', 'phone': '212-475-8592', 'genres': ['Jazz'], 'seeking_talent': 'NO'}
+        errors = validation.validate_many([
+            valid,
+            dict(valid, phone='415-475-8592'),
+            dict(valid, state='XX', genres=['Polka']),
+            dict(valid, seeking_talent='YES'),
+        ], 'venue')
+        self.assertEqual(errors[0], {})
+        self.assertEqual(list(errors[1]), ['phone'])
+        self.assertEqual(sorted(errors[2]), ['genres', 'phone', 'state'])
+        self.assertEqual(list(errors[3]), ['seeking_description'])
+
+    def test_datetime_filter_accepts_native_and_string_values(self):
+        value = datetime(2020, 1, 2, 21, 30)
+        self.assertEqual(fyyur.format_datetime(value, 'full'), "Thursday January, 2, 2020 at 9:30PM")
+        self.assertEqual(fyyur.format_datetime(str(value), 'full'), fyyur.format_datetime(value, 'full'))
+
+    def test_show_missing_venue_redirects(self):
+        res = self.client().get('/venues/1000')
+        self.assertEqual(res.status_code, 302)
+
+    def test_metrics_count_pool_and_view_queries(self):
+        page_cache.clear()
+        db_metrics.reset()
+        self.client().get('/venues')
+        body = self.client().get('/metrics').get_data(as_text=True)
+        self.assertIn('fyyur_view_requests_total{view="venues"} 1', body)
+        self.assertIn('fyyur_view_queries_total{view="venues"} 1', body)
+        self.assertIn('fyyur_view_query_seconds_count{view="venues"} 1', body)
+        self.assertIn('fyyur_db_pool_active_connections 0', body)
+        self.assertNotIn('fyyur_db_pool_checkouts_total 0', body)
+
+    def test_pool_options_from_config(self):
+        config = {'DB_POOL_SIZE': 20, 'DB_POOL_OVERFLOW': 0, 'DB_POOL_RECYCLE': 600, 'DB_STATEMENT_TIMEOUT': 5000}
+        self.assertEqual(metrics.pool_options(config, 'sqlite'), {})
+        options = metrics.pool_options(config, 'postgresql')
+        self.assertEqual(options['pool_size'], 20)
+        self.assertEqual(options['max_overflow'], 0)
+        self.assertEqual(options['pool_recycle'], 600)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=5000'})
+
+    def test_sql_profile_flags_repeated_statements(self):
+        app.config.update(SQL_PROFILE=True, SQL_PROFILE_SAMPLE_RATE=1.0, SQL_PROFILE_REPEAT=3)
+        try:
+            with app.test_request_context('/venues'), self.assertLogs('fyyur.sql', 'INFO') as logs:
+                app.preprocess_request()
+                for venue_id in (1, 2, 3):
+                    Venue.query.get(venue_id)
+                response = app.process_response(app.response_class('ok'))
+        finally:
+            app.config['SQL_PROFILE'] = False
+        self.assertIn('db;dur=', response.headers['Server-Timing'])
+        self.assertIn('n1;desc="1 repeated statements"', response.headers['Server-Timing'])
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['queries'], 3)
+        self.assertEqual(line['n_plus_one'][0]['count'], 3)
+        self.assertTrue(line['n_plus_one'][0]['call_sites'][0].startswith('test_app.py:'))
+
+    def test_sql_profile_off_by_default(self):
+        res = self.client().get('/venues')
+        self.assertNotIn('Server-Timing', res.headers)
+        self.assertEqual(profiler.statement_shape("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'x'"),
+                         "SELECT * FROM t WHERE id IN (?) AND name = ?")
+
+    async def async_get(self, *paths):
+        async with async_api.api.test_app() as test_app:
+            client = test_app.test_client()
+            responses = [await client.get(path) for path in paths]
+            return [(res.status_code, await res.get_json()) for res in responses]
+
+    def test_async_api_reads(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'async.db')
+            app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+            async_api.api.config['ASYNC_DATABASE_URI'] = 'sqlite+aiosqlite:///' + path
+            try:
+                self.seed()
+                with app.app_context():
+                    # venue 1's counter row went stale when its next show started
+                    VenueShowCounts.query.get(1).next_show = datetime.today() - timedelta(minutes=1)
+                    VenueShowCounts.query.get(1).upcoming_shows = 99
+                    db.session.commit()
+                (status, venues), (_, page), (_, venue), (missing, _), (bad, _), (bad_cursor, _) = asyncio.run(
+                    self.async_get('/api/venues', '/api/venues?limit=1&after=1', '/api/venues/1', '/api/venues/99',
+                                   '/api/venues?limit=ten', '/api/shows?after=nocursor'))
+            finally:
+                async_api.api.config['ASYNC_DATABASE_URI'] = None
+                with app.app_context():
+                    db.session.remove()
+                    db.get_engine(app).dispose()
+                app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.assertEqual(status, 200)
+        self.assertEqual([v['num_upcoming_shows'] for v in venues['venues']], [2, 0, 1])
+        self.assertEqual([v['id'] for v in page['venues']], [2])
+        self.assertEqual(page['next'], 2)
+        self.assertEqual((venue['upcoming_shows_count'], venue['past_shows_count']), (2, 1))
+        self.assertEqual(sorted(venue['genres']), ['Folk', 'Jazz'])
+        self.assertEqual((missing, bad, bad_cursor), (404, 400, 400))
+
+    @contextmanager
+    def replica(self):
+        # A primary with "Primary Hall" and a lagging replica with "Replica Hall".
+        with tempfile.TemporaryDirectory() as directory:
+            app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(directory, 'primary.db')
+            app.config['SQLALCHEMY_BINDS'] = {'replica': 'sqlite:///' + os.path.join(directory, 'replica.db')}
+            try:
+                with app.app_context():
+                    db.create_all()
+                    db.Model.metadata.create_all(db.get_engine(app, 'replica'))
+                    db.session.add(Venue(id=1, name="Primary Hall", city="Austin", state="TX"))
+                    db.session.commit()
+                    with db.get_engine(app, 'replica').begin() as conn:
+                        conn.execute(Venue.__table__.insert(), {'id': 1, 'name': "Replica Hall", 'city': "Austin",
+                                                                'state': "TX"})
+                yield
+            finally:
+                app.config['SQLALCHEMY_BINDS'] = None
+                with app.app_context():
+                    db.session.remove()
+                    db.drop_all()
+                app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+
+    def create_blue_note(self, client):
+        res = client.post('/venues/create', data={
+            'name': 'The Blue Note', 'city': 'New York', 'state': 'NY', 'address': '131 W 3rd St',
+            'phone': '212-475-8592', 'genres': ['Jazz'], 'facebook_link': 'https://www.facebook.com/bluenote',
+            'website': 'https://www.bluenotejazz.com', 'seeking_talent': 'NO', 'seeking_description': ''
+        })
+        self.assertEqual(res.status_code, 302)
+        # the page after a write shows the flash message
+        client.get('/')
+
+    def test_reads_go_to_replica_until_a_write(self):
+        client = app.test_client()
+        with self.replica():
+            self.assertIn("Replica Hall", client.get('/venues').get_data(as_text=True))
+            res = client.post('/venues/search', data={'search_term': 'hall'})
+            self.assertIn("Replica Hall", res.get_data(as_text=True))
+            self.create_blue_note(client)
+            # the writer reads its own write from the primary...
+            body = client.get('/venues').get_data(as_text=True)
+            self.assertIn("Primary Hall", body)
+            self.assertIn("The Blue Note", body)
+            # ...until the sticky window is over
+            with client.session_transaction() as sess:
+                sess['primary_until'] = 0
+            self.assertIn("Replica Hall", client.get('/venues').get_data(as_text=True))
+
+    def test_lagging_replica_pages_are_not_cached_for_the_writer(self):
+        writer, reader = app.test_client(), app.test_client()
+        with self.replica():
+            self.assertIn("Replica Hall", reader.get('/venues').get_data(as_text=True))
+            self.create_blue_note(writer)
+            # another browser renders /venues from the replica, which has not
+            # seen the write yet; that page must not be served to the writer
+            self.assertNotIn("The Blue Note", reader.get('/venues').get_data(as_text=True))
+            body = writer.get('/venues').get_data(as_text=True)
+            self.assertIn("The Blue Note", body)
+            # and the writer's page from the primary is not cached either
+            self.assertIn("Replica Hall", reader.get('/venues').get_data(as_text=True))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
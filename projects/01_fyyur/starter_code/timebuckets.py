@@ -0,0 +1,40 @@
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import Date
+
+# ----------------------------------------------------------------------------#
+# Day and week buckets for GROUP BY.
+#
+# date_bucket('day' | 'week', column) is the first day of the bucket holding
+# each timestamp (weeks start on Monday), computed by the database so
+# calendar counts come out of a single GROUP BY.
+# ----------------------------------------------------------------------------#
+
+UNITS = ('day', 'week')
+
+
+class date_bucket(FunctionElement):
+    type = Date()
+    name = 'date_bucket'
+    inherit_cache = False  # the unit is compiled into the SQL
+
+    def __init__(self, unit, column):
+        if unit not in UNITS:
+            raise ValueError("Unknown bucket %r" % unit)
+        self.unit = unit
+        super(date_bucket, self).__init__(column)
+
+
+@compiles(date_bucket)
+def compile_date_bucket(element, compiler, **kw):
+    return "CAST(date_trunc('%s', %s) AS DATE)" % (element.unit, compiler.process(element.clauses, **kw))
+
+
+@compiles(date_bucket, 'sqlite')
+def compile_date_bucket_sqlite(element, compiler, **kw):
+    column = compiler.process(element.clauses, **kw)
+    if element.unit == 'week':
+        # forward to the week's Sunday, then back to its Monday
+        return "date(%s, 'weekday 0', '-6 days')" % column
+    return "date(%s)" % column
+
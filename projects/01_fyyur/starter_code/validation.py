@@ -0,0 +1,87 @@
+from wtforms.validators import ValidationError
+
+from common import GENRES, STATES, phone_dict
+
+# ----------------------------------------------------------------------------#
+# Validation rules shared by the forms, the importer and any caller that
+# needs to check many records without building a form per record.
+#
+# Lookups are frozensets built once at import time: area codes are kept as
+# their three-character strings, so a phone check is a slice and a set
+# membership test. The check_* functions raise ValidationError, which is a
+# ValueError.
+# ----------------------------------------------------------------------------#
+
+STATE_CODES = frozenset(state.value for state in STATES)
+GENRE_NAMES = frozenset(genre.name for genre in GENRES)
+AREA_CODES = dict((state, frozenset('%03d' % code for code in codes)) for state, codes in phone_dict.items())
+NO_AREA_CODES = frozenset()
+SEEKING_CHOICES = frozenset(['YES', 'NO'])
+
+
+def check_state(state):
+    if state not in STATE_CODES:
+        raise ValidationError("Invalid State")
+
+
+def check_genres(genres):
+    if not GENRE_NAMES.issuperset(genres):
+        raise ValidationError("Invalid Genre")
+
+
+def check_phone(phone, state):
+    # xxx-xxx-xxxx
+    # Phone number in USA: (area code 3 digits) (exchange 3 digits ) (number 4 digits)
+    # According to: https://www.quora.com/What-is-the-American-mobile-phone-number-format
+    if phone is None or len(phone) != 12 or phone[3] != "-" or phone[7] != "-" \
+            or phone[0:3] not in AREA_CODES.get(state, NO_AREA_CODES):
+        raise ValidationError("Invalid Phone Number, Must be exactly 12 characters")
+
+
+def check_seeking(seeking):
+    if seeking not in SEEKING_CHOICES:
+        raise ValidationError("Invalid choice for Seeking talent")
+
+
+def check_seeking_description(seeking, description):
+    if seeking == "YES" and not description:
+        raise ValidationError("Cannot leave Seeking Description empty if seeking venue is true")
+
+
+# Per-kind rules over plain dicts: (field, check taking the whole record).
+VENUE_RULES = (
+    ('state', lambda r: check_state(r.get('state'))),
+    ('phone', lambda r: check_phone(r.get('phone'), r.get('state'))),
+    ('genres', lambda r: check_genres(r.get('genres') or ())),
+    ('seeking_talent', lambda r: check_seeking(r.get('seeking_talent'))),
+    ('seeking_description', lambda r: check_seeking_description(r.get('seeking_talent'), r.get('seeking_description'))),
+)
+
+ARTIST_RULES = (
+    ('state', lambda r: check_state(r.get('state'))),
+    ('phone', lambda r: check_phone(r.get('phone'), r.get('state'))),
+    ('genres', lambda r: check_genres(r.get('genres') or ())),
+    ('seeking_venue', lambda r: check_seeking(r.get('seeking_venue'))),
+    ('seeking_description', lambda r: check_seeking_description(r.get('seeking_venue'), r.get('seeking_description'))),
+)
+
+RULES = {
+    'venue': VENUE_RULES,
+    'artist': ARTIST_RULES,
+}
+
+
+def validate(record, kind):
+    # {field: message} for every rule the record breaks; empty when valid.
+    errors = {}
+    for field, check in RULES[kind]:
+        try:
+            check(record)
+        except ValidationError as e:
+            errors[field] = str(e)
+    return errors
+
+
+def validate_many(records, kind):
+    # One error dict per record, in order; no form or request context needed.
+    return [validate(record, kind) for record in records]
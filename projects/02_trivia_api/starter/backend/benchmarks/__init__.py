@@ -0,0 +1,7 @@
+'''
+Benchmarks for the trivia API, run from the backend directory:
+
+  python -m benchmarks.bench_pagination
+
+They use a throw-away SQLite database unless DATABASE_URL points elsewhere.
+'''
@@ -0,0 +1,44 @@
+import argparse
+
+from flaskr import QUESTIONS_PER_PAGE, questions_index
+from models import db, Question
+from benchmarks.seed import make_app, seed, timed
+
+'''
+GET /questions latency by page depth: numbered pages (bounded offset from
+cached anchors), cursor pages (?after=) and, for comparison, a plain
+OFFSET/LIMIT query.
+
+  python -m benchmarks.bench_pagination [--questions 1000000] [--pages 1,10,100,1000,10000]
+'''
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--questions', type=int, default=1000000)
+  parser.add_argument('--pages', default='1,10,100,1000,10000')
+  args = parser.parse_args()
+
+  app = make_app()
+  client = app.test_client()
+  with app.app_context():
+    seed(args.questions)
+  # seeded with Core inserts, which do not fire the invalidation hook
+  questions_index.invalidate()
+  client.get('/questions')
+
+  print("%8s %12s %12s %12s" % ("page", "page ms", "cursor ms", "offset ms"))
+  for number in [int(x) for x in args.pages.split(',')]:
+    offset = (number - 1) * QUESTIONS_PER_PAGE
+    with app.app_context():
+      # ids are seeded densely, so the cursor for page n is the id before it
+      page_ms = timed(lambda: client.get('/questions?page=%d' % number))
+      cursor_ms = timed(lambda: client.get('/questions?after=%d' % offset))
+      offset_ms = timed(lambda: Question.query.order_by(Question.id)
+                        .offset(offset).limit(QUESTIONS_PER_PAGE).all())
+      db.session.remove()
+    print("%8d %12.2f %12.2f %12.2f" % (number, page_ms, cursor_ms, offset_ms))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,77 @@
+import argparse
+import os
+import random
+import time
+
+from flaskr import SEARCH_RESULTS, question_search
+from models import db, Question
+from benchmarks.seed import WORDS, make_app, seed
+
+'''
+Question search throughput: POST /questions with a searchTerm through the
+full-text index (tsvector + GIN on Postgres, the inverted index elsewhere),
+next to a LIKE scan for the same words.
+
+  python -m benchmarks.bench_search [--questions 100000] [--seconds 5]
+'''
+
+SEARCH_SQL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'question_search.psql')
+# the generated questions use every word of WORDS; these two are rarer
+RARE = ['zeppelin', 'harpsichord']
+
+
+def qps(fn, terms, seconds):
+  count = 0
+  start = time.perf_counter()
+  while time.perf_counter() - start < seconds:
+    fn(terms[count % len(terms)])
+    count += 1
+  return count / (time.perf_counter() - start)
+
+
+def like_scan(term):
+  query = Question.query
+  for word in term.split():
+    query = query.filter(Question.question.ilike('%' + word + '%'))
+  return query.limit(SEARCH_RESULTS).all(), query.count()
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--questions', type=int, default=100000)
+  parser.add_argument('--seconds', type=float, default=5)
+  args = parser.parse_args()
+
+  app = make_app()
+  client = app.test_client()
+  rnd = random.Random(99)
+  with app.app_context():
+    seed(args.questions)
+    # a few questions with rare words, for selective searches
+    for i in range(100):
+      db.session.add(Question('%s %s?' % (rnd.choice(RARE), ' '.join(rnd.choice(WORDS) for _ in range(6))),
+                              'answer', '1', 1))
+    db.session.commit()
+    if db.engine.dialect.name == 'postgresql':
+      db.session.execute(open(SEARCH_SQL).read())
+      db.session.commit()
+  # seeded with Core inserts, which the index does not see
+  question_search.reset()
+
+  searches = {
+    'rare word': RARE,
+    'common word': ['river', 'planet', 'capital'],
+    'two words': ['zeppelin river', 'capital planet'],
+  }
+  client.post('/questions', json={'searchTerm': 'warm up'})
+  print("%14s %12s %12s" % ("search", "index qps", "like qps"))
+  for name, terms in searches.items():
+    with app.app_context():
+      index_qps = qps(lambda term: client.post('/questions', json={'searchTerm': term}), terms, args.seconds)
+      like_qps = qps(like_scan, terms, args.seconds)
+      db.session.remove()
+    print("%14s %12.1f %12.1f" % (name, index_qps, like_qps))
+
+
+if __name__ == '__main__':
+  main()
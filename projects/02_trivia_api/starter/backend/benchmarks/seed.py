@@ -0,0 +1,55 @@
+import os
+import random
+import tempfile
+import time
+
+from flaskr import create_app
+from models import db, Question, Category
+
+'''
+Shared helpers for the benchmarks: an app on a scratch database and a
+generated question bank.
+'''
+
+CHUNK = 10000
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+WORDS = ['what', 'which', 'who', 'river', 'painter', 'capital', 'planet', 'team', 'film', 'element',
+         'longest', 'first', 'largest', 'country', 'world', 'cup', 'novel', 'author', 'ocean', 'mountain']
+
+
+def make_app(uri=None):
+  if uri is None:
+    uri = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+  return create_app({'database_path': uri})
+
+
+def seed(questions, rnd=None):
+  rnd = rnd or random.Random(1234)
+  db.drop_all()
+  db.create_all()
+  db.session.execute(Category.__table__.insert(), [{'id': i + 1, 'type': t} for i, t in enumerate(CATEGORIES)])
+  rows = []
+  for i in range(1, questions + 1):
+    rows.append({
+      'id': i,
+      'question': ' '.join(rnd.choice(WORDS) for _ in range(8)) + '?',
+      'answer': rnd.choice(WORDS),
+      'category': str(rnd.randint(1, len(CATEGORIES))),
+      'difficulty': rnd.randint(1, 5)
+    })
+    if len(rows) == CHUNK:
+      db.session.execute(Question.__table__.insert(), rows)
+      rows = []
+  if rows:
+    db.session.execute(Question.__table__.insert(), rows)
+  db.session.commit()
+
+
+def timed(fn, repeat=5):
+  # Median of `repeat` runs, in milliseconds.
+  runs = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn()
+    runs.append((time.perf_counter() - start) * 1000)
+  return sorted(runs)[len(runs) // 2]
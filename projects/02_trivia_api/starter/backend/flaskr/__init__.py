@@ -3,15 +3,72 @@ from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
+from sqlalchemy import inspect
 
-from models import setup_db, Question, Category
+from models import setup_db, on_commit, Question, Category, category_cache
+from . import pagination, quiz_sessions, sampling, search
 
 QUESTIONS_PER_PAGE = 10
+SEARCH_RESULTS = 50
+
+questions_index = pagination.PageIndex(lambda: Question.query, Question.id)
+
+def category_question_ids(category):
+  query = Question.query.with_entities(Question.id)
+  if category is not None:
+    query = query.filter(Question.category == category)
+  return [row[0] for row in query]
+
+question_sampler = sampling.QuestionSampler(category_question_ids)
+
+question_search = search.Search()
+
+def written_categories(question):
+  # a moved question also leaves its old category
+  return [question.category] + list(inspect(question).attrs.category.history.deleted)
+
+def invalidate_question_ids(categories):
+  for category in categories:
+    question_sampler.invalidate(category)
+
+on_commit(Question, invalidate_question_ids, keys=written_categories,
+          events=('after_insert', 'after_update', 'after_delete'))
+on_commit(Question, lambda keys: questions_index.invalidate())
+on_commit(Question, question_search.changed, keys=lambda question: [question.id],
+          events=('after_insert', 'after_update', 'after_delete'))
+
+def picked_question(pick, category, attempts=3):
+  # the sampler's ids can trail another process's delete: when the picked
+  # question is gone, reload the category's ids and pick again
+  for _ in range(attempts):
+    question_id = pick()
+    if question_id is None:
+      return None
+    question = Question.query.get(question_id)
+    if question is not None:
+      return question
+    question_sampler.invalidate(category)
+  return None
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
-  setup_db(app)
+  app.config.from_mapping(
+    QUIZ_SESSION_STORE=os.environ.get('QUIZ_SESSION_STORE', 'memory'),
+    QUIZ_SESSION_TTL=int(os.environ.get('QUIZ_SESSION_TTL', 3600)),
+    QUIZ_SESSION_MAXSIZE=int(os.environ.get('QUIZ_SESSION_MAXSIZE', 10000)),
+    QUIZ_REDIS_URL=os.environ.get('QUIZ_REDIS_URL', 'redis://localhost:6379/0')
+  )
+  if test_config is not None:
+    app.config.from_mapping(test_config)
+  if test_config is not None and 'database_path' in test_config:
+    setup_db(app, test_config['database_path'])
+  else:
+    setup_db(app)
+  if test_config is not None and 'quiz_seed' in test_config:
+    # a fixed seed makes the quiz question order repeatable
+    question_sampler.seed(test_config['quiz_seed'])
+  quiz_store = quiz_sessions.make_store(app.config)
   
   '''
   @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -40,6 +97,23 @@ def create_app(test_config=None):
   ten questions per page and pagination at the bottom of the screen for three pages.
   Clicking on the page numbers should update the questions. 
   '''
+  @app.route('/questions')
+  def get_questions():
+    # ?page=<n> for numbered pages, ?after=<id> to continue from next_cursor
+    try:
+      page = pagination.paginate(questions_index, request.args, QUESTIONS_PER_PAGE)
+    except ValueError:
+      abort(400)
+    if not page.items and page.page != 1:
+      abort(404)
+    return jsonify({
+      'success': True,
+      'questions': [question.format() for question in page.items],
+      'total_questions': page.total,
+      'next_cursor': page.next_cursor,
+      'categories': category_cache.types(),
+      'current_category': None
+    })
 
   '''
   @TODO: 
@@ -70,6 +144,21 @@ def create_app(test_config=None):
   only question that include that string within their question. 
   Try using the word "title" to start. 
   '''
+  @app.route('/questions', methods=['POST'])
+  def search_questions():
+    # every word of searchTerm must appear; best matches first, with the
+    # matched words wrapped in <mark> in `snippet`
+    body = request.get_json(silent=True) or {}
+    term = body.get('searchTerm')
+    if not isinstance(term, str):
+      abort(422)
+    total, questions = question_search.search(Question.query.session, Question, term, SEARCH_RESULTS)
+    return jsonify({
+      'success': True,
+      'questions': questions,
+      'total_questions': total,
+      'current_category': None
+    })
 
   '''
   @TODO: 
@@ -92,12 +181,78 @@ def create_app(test_config=None):
   one question at a time is displayed, the user is allowed to answer
   and shown whether they were correct or not. 
   '''
+  def quiz_request():
+    # the JSON body and its quiz_category id; 422 unless both are objects
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+      abort(422)
+    category = body.get('quiz_category') or {}
+    if not isinstance(category, dict):
+      abort(422)
+    try:
+      return body, int(category.get('id') or 0)
+    except (TypeError, ValueError):
+      abort(422)
+
+  @app.route('/quizzes', methods=['POST'])
+  def play_quiz():
+    body, category = quiz_request()
+    previous = body.get('previous_questions') or []
+    if not isinstance(previous, list):
+      abort(422)
+    try:
+      previous = [int(id) for id in previous]
+    except (TypeError, ValueError):
+      abort(422)
+    # category 0 is "All"
+    question = picked_question(lambda: question_sampler.pick(category or None, previous), category or None)
+    return jsonify({
+      'success': True,
+      'question': question.format() if question is not None else None
+    })
+
+  '''
+  Quiz sessions: the server remembers the played questions, so each request
+  carries only the session token.
+  '''
+  @app.route('/quizzes/sessions', methods=['POST'])
+  def start_quiz_session():
+    body, category = quiz_request()
+    token = quiz_sessions.new_token()
+    quiz_store.start(token, category)
+    return jsonify({'success': True, 'token': token})
+
+  @app.route('/quizzes/sessions/<token>', methods=['POST'])
+  def next_quiz_question(token):
+    session = quiz_store.session(token)
+    if session is None:
+      abort(404)
+    category, digest = session
+    played = quiz_sessions.Played(quiz_store, token, digest)
+    question = picked_question(lambda: question_sampler.pick_unseen(category or None, played), category or None)
+    if question is not None:
+      question_sampler.mark(category or None, played, question.id)
+    return jsonify({
+      'success': True,
+      'question': question.format() if question is not None else None
+    })
 
   '''
   @TODO: 
   Create error handlers for all expected errors 
   including 404 and 422. 
   '''
+  @app.errorhandler(400)
+  def bad_request(error):
+    return jsonify({'success': False, 'error': 400, 'message': 'bad request'}), 400
+
+  @app.errorhandler(404)
+  def not_found(error):
+    return jsonify({'success': False, 'error': 404, 'message': 'resource not found'}), 404
+
+  @app.errorhandler(422)
+  def unprocessable(error):
+    return jsonify({'success': False, 'error': 422, 'message': 'unprocessable'}), 422
   
   return app
 
@@ -0,0 +1,105 @@
+import threading
+import time
+
+from sqlalchemy import func
+
+'''
+Pagination over a query ordered by id.
+
+Two modes, picked from the request arguments:
+  ?after=<id>  keyset: the next page is `id > after ORDER BY id LIMIT n`,
+               an index range scan whatever the depth.
+  ?page=<n>    bounded offset: every `stride`-th id is cached as an anchor,
+               so page n is `id >= anchor ORDER BY id OFFSET k LIMIT n` with
+               k < stride, instead of an OFFSET that grows with n.
+
+The row count and the anchors are computed once and kept until invalidate()
+is called (after a commit that inserted or deleted rows) or `ttl` seconds
+pass, which bounds how long other processes' writes go unseen.
+'''
+
+DEFAULT_STRIDE = 1000
+DEFAULT_TTL = 300
+
+
+class Page(object):
+  def __init__(self, items, total, page=None, next_cursor=None):
+    self.items = items
+    self.total = total
+    self.page = page
+    self.next_cursor = next_cursor
+
+
+class PageIndex(object):
+  '''
+  PageIndex(query, id_column)
+    `query` is a function returning the base query, so it is built inside
+    the request's app context.
+  '''
+  def __init__(self, query, id_column, stride=DEFAULT_STRIDE, ttl=DEFAULT_TTL):
+    self.query = query
+    self.id_column = id_column
+    self.stride = stride
+    self.ttl = ttl
+    self.lock = threading.Lock()
+    self.version = 0
+    self._state = None
+
+  def invalidate(self):
+    self.version += 1
+
+  def fresh(self, state):
+    return state is not None and state[3] == self.version and (not self.ttl or time.time() - state[2] < self.ttl)
+
+  def state(self):
+    # (total, anchors, loaded at, version), read as one value so a
+    # concurrent invalidate() cannot split it
+    state = self._state
+    if self.fresh(state):
+      return state
+    with self.lock:
+      # threads that waited for the lock use the state just loaded
+      state = self._state
+      if self.fresh(state):
+        return state
+      version = self.version
+      numbered = self.query().with_entities(
+        self.id_column.label('id'),
+        func.row_number().over(order_by=self.id_column).label('n')
+      ).subquery()
+      anchors = [row[0] for row in self.query().session.query(numbered.c.id)
+                 .filter((numbered.c.n - 1) % self.stride == 0)
+                 .order_by(numbered.c.id)]
+      total = self.query().with_entities(func.count(self.id_column)).scalar()
+      self._state = state = (total, anchors, time.time(), version)
+    return state
+
+  def total(self):
+    return self.state()[0]
+
+  def page(self, number, per_page):
+    total, anchors, _, _ = self.state()
+    offset = (number - 1) * per_page
+    if number < 1 or offset >= total:
+      return Page([], total, number)
+    items = self.query().filter(self.id_column >= anchors[offset // self.stride]) \
+      .order_by(self.id_column).offset(offset % self.stride).limit(per_page).all()
+    next_cursor = items[-1].id if offset + per_page < total else None
+    return Page(items, total, number, next_cursor)
+
+  def after(self, cursor, per_page):
+    items = self.query().filter(self.id_column > cursor) \
+      .order_by(self.id_column).limit(per_page + 1).all()
+    next_cursor = items[per_page - 1].id if len(items) > per_page else None
+    return Page(items[:per_page], self.total(), None, next_cursor)
+
+
+'''
+paginate(index, args, per_page)
+  One page for the request arguments; raises ValueError on a malformed
+  `page` or `after`.
+'''
+def paginate(index, args, per_page):
+  if args.get('after'):
+    return index.after(int(args['after']), per_page)
+  return index.page(int(args.get('page', 1)), per_page)
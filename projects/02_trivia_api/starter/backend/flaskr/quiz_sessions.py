@@ -0,0 +1,220 @@
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+try:
+  import redis
+except ImportError:  # only needed for QUIZ_SESSION_STORE = 'redis'
+  redis = None
+
+'''
+Server-side quiz sessions.
+
+A session is a token, the quiz category and the set of questions already
+played, kept as a bitmap indexed by position in the category's sorted id
+array (bit 7 - p % 8 of byte p // 8, the order Redis SETBIT uses), so it
+takes one bit per question of the category whatever the ids are. The
+session also keeps the digest of the id array its positions refer to; when
+the category's ids change, Played.rebase() moves the played positions to the
+new array. The client sends only the token, so a quiz request has the same
+size and cost on the first question as on the thousandth.
+
+Stores: MemoryStore (in-process LRU with a TTL) and RedisStore (any client
+with the redis-py API; sessions are shared between workers). A pick probes
+all its candidate positions in one call (one pipelined round trip on Redis).
+'''
+
+
+def new_token():
+  return secrets.token_urlsafe(16)
+
+
+def bitmap_positions(bitmap):
+  positions = []
+  for byte_index, byte in enumerate(bitmap):
+    if byte:
+      for bit in range(8):
+        if byte & (0x80 >> bit):
+          positions.append(byte_index * 8 + bit)
+  return positions
+
+
+def set_bit(bitmap, position):
+  if position // 8 >= len(bitmap):
+    bitmap.extend(bytes(position // 8 + 1 - len(bitmap)))
+  bitmap[position // 8] |= 0x80 >> position % 8
+
+
+def is_set(bitmap, position):
+  return position // 8 < len(bitmap) and bool(bitmap[position // 8] & (0x80 >> position % 8))
+
+
+def clear_position(bitmap, size, randrange):
+  # a random position below `size` whose bit is clear, or None
+  bitmap = bytes(bitmap[:(size + 7) // 8])
+  free = size - bin(int.from_bytes(bitmap, 'big')).count('1')
+  if free <= 0:
+    return None
+  r = randrange(free)
+  for byte_index in range((size + 7) // 8):
+    byte = bitmap[byte_index] if byte_index < len(bitmap) else 0
+    clear = 8 - bin(byte).count('1')
+    if r >= clear:
+      r -= clear
+      continue
+    for bit in range(8):
+      if not byte & (0x80 >> bit):
+        if r == 0:
+          return byte_index * 8 + bit
+        r -= 1
+  return None
+
+
+class Played(object):
+  '''
+  Played(store, token, digest)
+    the played questions of one session, as positions in the id array
+    named by `digest` (None until the first pick).
+  '''
+  def __init__(self, store, token, digest):
+    self.store = store
+    self.token = token
+    self.digest = digest
+
+  def are_seen(self, positions):
+    return self.store.are_seen(self.token, positions)
+
+  def mark(self, position):
+    self.store.mark(self.token, position)
+
+  def unseen(self, size, randrange):
+    return clear_position(self.store.bitmap(self.token), size, randrange)
+
+  def rebase(self, old_ids, ids, digest):
+    # move the played positions from old_ids to ids; when old_ids is no
+    # longer known (None) the session starts over
+    bitmap = bytearray()
+    if old_ids is not None:
+      for position in bitmap_positions(self.store.bitmap(self.token)):
+        if position < len(old_ids):
+          i = bisect_left(ids, old_ids[position])
+          if i < len(ids) and ids[i] == old_ids[position]:
+            set_bit(bitmap, i)
+    self.store.rebase(self.token, digest, bytes(bitmap))
+    self.digest = digest
+
+
+class MemoryStore(object):
+  def __init__(self, maxsize=10000, ttl=3600):
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self.sessions = OrderedDict()  # token -> [category, bitmap, expires at, digest]
+    self.lock = threading.Lock()
+
+  def _get(self, token):
+    session = self.sessions.get(token)
+    if session is None:
+      return None
+    if session[2] < time.time():
+      del self.sessions[token]
+      return None
+    session[2] = time.time() + self.ttl
+    self.sessions.move_to_end(token)
+    return session
+
+  def start(self, token, category):
+    with self.lock:
+      self.sessions[token] = [category, bytearray(), time.time() + self.ttl, None]
+      while len(self.sessions) > self.maxsize:
+        self.sessions.popitem(last=False)
+
+  def session(self, token):
+    # (category, digest) or None
+    with self.lock:
+      session = self._get(token)
+      return (session[0], session[3]) if session is not None else None
+
+  def _bitmap(self, token):
+    session = self._get(token)
+    return session[1] if session is not None else bytearray()
+
+  def are_seen(self, token, positions):
+    with self.lock:
+      bitmap = self._bitmap(token)
+      return [is_set(bitmap, position) for position in positions]
+
+  def mark(self, token, position):
+    with self.lock:
+      set_bit(self._bitmap(token), position)
+
+  def bitmap(self, token):
+    with self.lock:
+      return bytes(self._bitmap(token))
+
+  def rebase(self, token, digest, bitmap):
+    with self.lock:
+      session = self._get(token)
+      if session is not None:
+        session[1] = bytearray(bitmap)
+        session[3] = digest
+
+
+class RedisStore(object):
+  def __init__(self, client, ttl=3600, prefix='trivia:quiz:'):
+    self.client = client
+    self.ttl = ttl
+    self.prefix = prefix
+
+  def start(self, token, category):
+    pipe = self.client.pipeline()
+    pipe.delete(self.prefix + token, self.prefix + token + ':seen')
+    pipe.hset(self.prefix + token, 'category', category)
+    pipe.expire(self.prefix + token, self.ttl)
+    pipe.execute()
+
+  def session(self, token):
+    pipe = self.client.pipeline()
+    pipe.hmget(self.prefix + token, 'category', 'ids')
+    pipe.expire(self.prefix + token, self.ttl)
+    pipe.expire(self.prefix + token + ':seen', self.ttl)
+    (category, digest), _, _ = pipe.execute()
+    if category is None:
+      return None
+    return int(category), digest.decode() if digest is not None else None
+
+  def are_seen(self, token, positions):
+    pipe = self.client.pipeline(transaction=False)
+    for position in positions:
+      pipe.getbit(self.prefix + token + ':seen', position)
+    return [bool(bit) for bit in pipe.execute()]
+
+  def mark(self, token, position):
+    pipe = self.client.pipeline()
+    pipe.setbit(self.prefix + token + ':seen', position, 1)
+    pipe.expire(self.prefix + token + ':seen', self.ttl)
+    pipe.execute()
+
+  def bitmap(self, token):
+    return self.client.get(self.prefix + token + ':seen') or b''
+
+  def rebase(self, token, digest, bitmap):
+    pipe = self.client.pipeline()
+    pipe.hset(self.prefix + token, 'ids', digest)
+    pipe.delete(self.prefix + token + ':seen')
+    if bitmap:
+      pipe.set(self.prefix + token + ':seen', bitmap, ex=self.ttl)
+    pipe.execute()
+
+
+def make_store(config):
+  name = config.get('QUIZ_SESSION_STORE', 'memory')
+  ttl = config.get('QUIZ_SESSION_TTL', 3600)
+  if name == 'memory':
+    return MemoryStore(config.get('QUIZ_SESSION_MAXSIZE', 10000), ttl)
+  if name == 'redis':
+    if redis is None:
+      raise RuntimeError("QUIZ_SESSION_STORE = 'redis' needs the redis package")
+    return RedisStore(redis.Redis.from_url(config['QUIZ_REDIS_URL']), ttl)
+  raise ValueError("Unknown QUIZ_SESSION_STORE %r" % name)
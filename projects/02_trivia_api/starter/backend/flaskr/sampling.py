@@ -0,0 +1,138 @@
+import bisect
+import hashlib
+import random
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+'''
+Uniform random question picking for the quiz.
+
+The ids of each category (and of all questions, under None) are loaded once
+into a sorted array and kept until a commit inserts, deletes or moves a
+question of that category, or `ttl` seconds pass, which bounds how long
+other processes' writes go unseen. A pick draws r from the ids not yet played
+and returns the r-th of them: the played ids are located with bisect and
+skipped, so a pick costs O(m log n) for m previous questions, with no table
+scan and no ORDER BY random().
+
+pick_unseen() serves quiz sessions (quiz_sessions.Played) that keep the played
+set themselves, as positions in the id array: it draws `tries` positions and
+probes them together, which finds an unplayed one while most of the category
+is unplayed, and otherwise picks among the clear bits of the session's
+bitmap. Each loaded array has a digest of its ids; a session built on an
+older array is rebased onto the current one, using the last ARCHIVED arrays.
+
+Ids from another process's delete can still be cached: a caller that finds
+the picked question gone invalidates the category and picks again.
+'''
+
+DEFAULT_TTL = 300
+ARCHIVED = 8
+
+
+class QuestionSampler(object):
+  '''
+  QuestionSampler(load_ids, seed=None, ttl=DEFAULT_TTL)
+    `load_ids(category)` returns the question ids of a category, or of all
+    questions when category is None.
+  '''
+  def __init__(self, load_ids, seed=None, ttl=DEFAULT_TTL):
+    self.load_ids = load_ids
+    self.rng = random.Random(seed)
+    self.ttl = ttl
+    self.lock = threading.Lock()
+    self.load_lock = threading.Lock()
+    self.version = 0
+    self.ids = {}  # category -> (ids, loaded at, digest)
+    self.archive = OrderedDict()  # digest -> ids
+
+  def seed(self, seed):
+    self.rng.seed(seed)
+
+  def invalidate(self, category=None):
+    # A question changes its own category's ids and the "all" ids. The
+    # version bump also drops ids a concurrent load read before the write.
+    self.version += 1
+    self.ids.pop(None, None)
+    if category is None:
+      self.ids.clear()
+    else:
+      self.ids.pop(str(category), None)
+
+  def fresh(self, loaded):
+    return loaded is not None and (not self.ttl or time.time() - loaded[1] < self.ttl)
+
+  def loaded(self, category):
+    # (ids, digest of the ids)
+    key = None if category is None else str(category)
+    loaded = self.ids.get(key)
+    if self.fresh(loaded):
+      return loaded[0], loaded[2]
+    with self.load_lock:
+      # threads that waited for the lock use the ids just loaded
+      loaded = self.ids.get(key)
+      if self.fresh(loaded):
+        return loaded[0], loaded[2]
+      version = self.version
+      ids = array('q', sorted(self.load_ids(key)))
+      digest = hashlib.blake2b(ids.tobytes(), digest_size=12).hexdigest()
+      if version == self.version:
+        self.ids[key] = (ids, time.time(), digest)
+      self.archive[digest] = ids
+      self.archive.move_to_end(digest)
+      while len(self.archive) > ARCHIVED:
+        self.archive.popitem(last=False)
+    return ids, digest
+
+  def category_ids(self, category):
+    return self.loaded(category)[0]
+
+  def randrange(self, n):
+    with self.lock:
+      return self.rng.randrange(n)
+
+  def played_in(self, category, played):
+    # the category's ids, with `played` rebased onto them
+    ids, digest = self.loaded(category)
+    if played.digest != digest:
+      played.rebase(self.archive.get(played.digest), ids, digest)
+    return ids
+
+  def pick(self, category=None, exclude=()):
+    ids = self.category_ids(category)
+    skipped = set()
+    for id in exclude:
+      i = bisect.bisect_left(ids, id)
+      if i < len(ids) and ids[i] == id:
+        skipped.add(i)
+    remaining = len(ids) - len(skipped)
+    if remaining <= 0:
+      return None
+    with self.lock:
+      r = self.rng.randrange(remaining)
+    # r counts only unplayed ids; step over each played position at or before it
+    for i in sorted(skipped):
+      if i > r:
+        break
+      r += 1
+    return ids[r]
+
+  def pick_unseen(self, category, played, tries=8):
+    ids = self.played_in(category, played)
+    if not ids:
+      return None
+    with self.lock:
+      positions = [self.rng.randrange(len(ids)) for _ in range(tries)]
+    for position, seen in zip(positions, played.are_seen(positions)):
+      if not seen:
+        return ids[position]
+    position = played.unseen(len(ids), self.randrange)
+    return ids[position] if position is not None else None
+
+  def mark(self, category, played, id):
+    ids = self.played_in(category, played)
+    i = bisect.bisect_left(ids, id)
+    if i < len(ids) and ids[i] == id:
+      played.mark(i)
@@ -0,0 +1,214 @@
+import heapq
+import html
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import text
+
+'''
+Full-text question search with ranking and highlighted snippets.
+
+On PostgreSQL the `search_vector` tsvector column and its GIN index (see
+question_search.psql) answer the query, ranked with ts_rank_cd and
+highlighted with ts_headline. Elsewhere (SQLite test runs) an in-process
+inverted index maps each word to the questions containing it and ranks the
+matches with BM25. The index is told the ids of committed question writes
+(changed()) and re-reads those rows before the next search; it is rebuilt
+after `ttl` seconds, which bounds how long other processes' writes go unseen. Both treat the search term as words that must all occur.
+The snippet is HTML: the question text escaped as html.escape() does, with
+the matches in <mark></mark>.
+'''
+
+WORD = re.compile(r'\w+', re.UNICODE)
+STOPWORDS = frozenset([
+  'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'did', 'do', 'for', 'from', 'has', 'in', 'is', 'it',
+  'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what', 'which', 'who', 'whose', 'with'
+])
+HIGHLIGHT = ('<mark>', '</mark>')
+K1 = 1.2
+B = 0.75
+DEFAULT_TTL = 300
+
+
+def words(value):
+  return [word for word in WORD.findall((value or '').lower()) if word not in STOPWORDS]
+
+
+def highlight(value, terms):
+  # matched on the raw text and escaped piece by piece, so a term cannot
+  # match inside an entity such as &lt;
+  value = value or ''
+  if not terms:
+    return html.escape(value)
+  pattern = re.compile(r'\b(%s)\b' % '|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+  parts = []
+  end = 0
+  for match in pattern.finditer(value):
+    parts.append(html.escape(value[end:match.start()]))
+    parts.append(HIGHLIGHT[0] + html.escape(match.group(0)) + HIGHLIGHT[1])
+    end = match.end()
+  parts.append(html.escape(value[end:]))
+  return ''.join(parts)
+
+
+class InvertedIndex(object):
+  def __init__(self):
+    self.postings = defaultdict(dict)   # word -> {id: term frequency}
+    self.lengths = {}                   # id -> number of words
+    self.vocabulary = {}                # id -> its distinct words
+    self.total_length = 0
+
+  def add(self, id, value):
+    self.discard(id)
+    tokens = words(value)
+    self.lengths[id] = len(tokens)
+    self.vocabulary[id] = frozenset(tokens)
+    self.total_length += len(tokens)
+    for word in tokens:
+      posting = self.postings[word]
+      posting[id] = posting.get(id, 0) + 1
+
+  def discard(self, id):
+    if id not in self.lengths:
+      return
+    self.total_length -= self.lengths.pop(id)
+    for word in self.vocabulary.pop(id):
+      del self.postings[word][id]
+      if not self.postings[word]:
+        del self.postings[word]
+
+  def search(self, term, limit):
+    # (number of matches, [(id, score)] best first, at most `limit`)
+    terms = sorted(set(words(term)), key=lambda word: len(self.postings.get(word, ())))
+    if not terms or terms[0] not in self.postings:
+      return 0, []
+    matches = set(self.postings[terms[0]]).intersection(*(self.postings.get(word, ()) for word in terms[1:]))
+    count = len(self.lengths)
+    average = float(self.total_length) / count if count else 0.0
+    weights = [(self.postings[word], math.log(1 + (count - len(self.postings[word]) + 0.5) /
+                                              (len(self.postings[word]) + 0.5))) for word in terms]
+
+    def score(id):
+      norm = K1 * (1 - B + B * self.lengths[id] / average) if average else K1
+      return sum(idf * posting[id] * (K1 + 1) / (posting[id] + norm) for posting, idf in weights)
+
+    best = heapq.nsmallest(limit, ((-score(id), id) for id in matches))
+    return len(matches), [(id, -score) for score, id in best]
+
+
+class FullTextSearch(object):
+  # ts_headline leaves the text's markup as it is, so the question is escaped
+  # first (the same five characters as html.escape); the parser reads the
+  # entities as entity tokens, never as words to highlight
+  QUERY = text('''
+    SELECT q.id, q.question, q.answer, q.category, q.difficulty, q.rank, q.total,
+           ts_headline('english',
+                       replace(replace(replace(replace(replace(q.question,
+                         '&', '&amp;'), '<', '&lt;'), '>', '&gt;'), '"', '&quot;'), chr(39), '&#x27;'),
+                       plainto_tsquery('english', :term),
+                       'StartSel=<mark>, StopSel=</mark>, HighlightAll=true') AS snippet
+    FROM (
+      SELECT id, question, answer, category, difficulty,
+             ts_rank_cd(search_vector, query) AS rank, count(*) OVER () AS total
+      FROM questions, plainto_tsquery('english', :term) AS query
+      WHERE search_vector @@ query
+      ORDER BY rank DESC, id
+      LIMIT :limit
+    ) AS q
+    ORDER BY q.rank DESC, q.id
+  ''')
+
+  def search(self, session, model, term, limit):
+    # headlines are built for the returned page only, after the LIMIT
+    rows = session.execute(self.QUERY, {'term': term, 'limit': limit}).fetchall()
+    total = rows[0].total if rows else 0
+    return total, [{
+      'id': row.id,
+      'question': row.question,
+      'answer': row.answer,
+      'category': row.category,
+      'difficulty': row.difficulty,
+      'rank': float(row.rank),
+      'snippet': row.snippet
+    } for row in rows]
+
+
+class IndexSearch(object):
+  def __init__(self, ttl=DEFAULT_TTL):
+    self.ttl = ttl
+    self.index = None
+    self.loaded_at = None
+    self.pending = set()  # ids written by committed transactions
+    self.lock = threading.Lock()
+
+  def reset(self):
+    with self.lock:
+      self.index = None
+
+  def changed(self, ids):
+    with self.lock:
+      self.pending.update(ids)
+
+  def refresh(self, session, model):
+    # call with the lock held; the pending ids are taken before the rows are
+    # read, so a commit during the read is applied on the next search
+    if self.index is None or (self.ttl and time.time() - self.loaded_at >= self.ttl):
+      self.pending = set()
+      self.loaded_at = time.time()
+      index = InvertedIndex()
+      for id, question in session.query(model.id, model.question):
+        index.add(id, question)
+      self.index = index
+    elif self.pending:
+      ids, self.pending = self.pending, set()
+      questions = dict(session.query(model.id, model.question).filter(model.id.in_(ids)))
+      for id in ids:
+        if id in questions:
+          self.index.add(id, questions[id])
+        else:
+          self.index.discard(id)
+    return self.index
+
+  def search(self, session, model, term, limit):
+    with self.lock:
+      total, scored = self.refresh(session, model).search(term, limit)
+    questions = dict((q.id, q) for q in session.query(model).filter(model.id.in_([id for id, _ in scored])))
+    terms = words(term)
+    results = []
+    for id, score in scored:
+      question = questions.get(id)
+      if question is not None:
+        result = question.format()
+        result['rank'] = score
+        result['snippet'] = highlight(question.question, terms)
+        results.append(result)
+    return total, results
+
+
+class Search(object):
+  '''
+  Search(backend=None)
+    backend: 'fulltext', 'index' or None to pick by database dialect.
+  '''
+  def __init__(self, backend=None):
+    self.backend_name = backend
+    self.backends = {'fulltext': FullTextSearch(), 'index': IndexSearch()}
+
+  def backend(self, session):
+    name = self.backend_name
+    if name is None:
+      name = 'fulltext' if session.bind.dialect.name == 'postgresql' else 'index'
+    return self.backends[name]
+
+  def search(self, session, model, term, limit):
+    return self.backend(session).search(session, model, term, limit)
+
+  def changed(self, ids):
+    # ids of questions written by a committed transaction
+    self.backends['index'].changed(ids)
+
+  def reset(self):
+    self.backends['index'].reset()
@@ -1,5 +1,7 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import threading
+from sqlalchemy import Column, String, Integer, create_engine, event
+from sqlalchemy.orm import Session, object_session
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -75,4 +77,64 @@ class Category(db.Model):
     return {
       'id': self.id,
       'type': self.type
-    }
\ No newline at end of file
+    }
+
+'''
+on_commit(model, callback, keys=None, events=('after_insert', 'after_delete'))
+    calls callback(written keys) once a session that wrote `model` rows
+    commits; keys(target) returns the keys a written row touches. Caches
+    invalidated here cannot be reloaded between the flush and the commit,
+    and a rolled back write invalidates nothing.
+'''
+def on_commit(model, callback, keys=None, events=('after_insert', 'after_delete')):
+  # one flag per registration, so callbacks for the same model do not take
+  # each other's writes
+  flag = ('written', model.__tablename__, object())
+
+  def written(mapper, connection, target):
+    touched = object_session(target).info.setdefault(flag, set())
+    if keys is not None:
+      touched.update(keys(target))
+
+  def committed(session):
+    if flag in session.info:
+      callback(session.info.pop(flag))
+
+  def rolled_back(session):
+    session.info.pop(flag, None)
+
+  for name in events:
+    event.listen(model, name, written)
+  event.listen(Session, 'after_commit', committed)
+  event.listen(Session, 'after_rollback', rolled_back)
+
+'''
+CategoryCache
+    id -> type of every category, loaded once per process. A committed
+    category write bumps `version` and the next read reloads, so question
+    listings embed the categories without querying the table on each request.
+'''
+class CategoryCache(object):
+  def __init__(self):
+    self.version = 0
+    self.lock = threading.Lock()
+    self._loaded = None  # (version, types)
+
+  def invalidate(self):
+    self.version += 1
+
+  def types(self):
+    # shared between requests: do not modify the returned dict
+    loaded = self._loaded
+    if loaded is None or loaded[0] != self.version:
+      with self.lock:
+        loaded = self._loaded
+        if loaded is None or loaded[0] != self.version:
+          version = self.version
+          types = {category.id: category.type for category in Category.query.order_by(Category.id)}
+          loaded = self._loaded = (version, types)
+    return loaded[1]
+
+category_cache = CategoryCache()
+on_commit(Category, lambda keys: category_cache.invalidate(),
+          events=('after_insert', 'after_update', 'after_delete'))
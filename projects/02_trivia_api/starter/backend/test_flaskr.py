@@ -1,10 +1,15 @@
 import os
+import threading
+import time
 import unittest
 import json
+from unittest import mock
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import setup_db, db, Question, Category, category_cache
+from flaskr import pagination, question_sampler, question_search, quiz_sessions, questions_index, sampling, search
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -33,7 +38,362 @@ class TriviaTestCase(unittest.TestCase):
     TODO
     Write at least one test for each test for successful operation and for expected errors.
     """
+    def test_get_questions_paginated(self):
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
 
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertTrue(data['total_questions'])
+        self.assertLessEqual(len(data['questions']), 10)
+        self.assertTrue(len(data['categories']))
+
+    def test_get_questions_by_cursor(self):
+        first = json.loads(self.client().get('/questions?page=1').data)
+        second = json.loads(self.client().get('/questions?after=%d' % first['next_cursor']).data)
+        page_two = json.loads(self.client().get('/questions?page=2').data)
+
+        self.assertEqual(second['total_questions'], first['total_questions'])
+        self.assertEqual([q['id'] for q in second['questions']], [q['id'] for q in page_two['questions']])
+        self.assertGreater(second['questions'][0]['id'], first['questions'][-1]['id'])
+
+    def test_404_requesting_beyond_valid_page(self):
+        res = self.client().get('/questions?page=1000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'resource not found')
+
+    def test_400_malformed_page(self):
+        res = self.client().get('/questions?page=first')
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(json.loads(res.data)['success'], False)
+
+    def test_questions_index_invalidated_on_commit(self):
+        self.client().get('/questions')
+        version = questions_index.version
+        with self.app.app_context():
+            db.session.add(Question('Rolled back?', 'Yes', '1', 1))
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(questions_index.version, version)
+            question = Question('Committed?', 'Yes', '1', 1)
+            question.insert()
+            self.assertEqual(questions_index.version, version + 1)
+            question.delete()
+
+    def test_page_index_loads_once_for_waiting_threads(self):
+        loads = []
+
+        def query():
+            loads.append(1)
+            time.sleep(0.01)
+            return Question.query
+
+        index = pagination.PageIndex(query, Question.id)
+
+        def read():
+            with self.app.app_context():
+                index.total()
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # the window query, the anchors and the count: one load
+        self.assertEqual(len(loads), 3)
+
+    def category_queries(self, fn):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            fn()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return [statement for statement in statements if 'categories' in statement]
+
+    def test_questions_embed_cached_categories(self):
+        self.client().get('/questions')
+        queries = self.category_queries(lambda: self.client().get('/questions?page=2'))
+
+        self.assertEqual(queries, [])
+
+    def test_category_cache_reloads_after_category_write(self):
+        self.client().get('/questions')
+        version = category_cache.version
+        with self.app.app_context():
+            category = Category('Zoology')
+            db.session.add(category)
+            db.session.commit()
+            category_id = category.id
+        try:
+            self.assertEqual(category_cache.version, version + 1)
+            data = json.loads(self.client().get('/questions').data)
+            self.assertEqual(data['categories'][str(category_id)], 'Zoology')
+        finally:
+            with self.app.app_context():
+                db.session.delete(Category.query.get(category_id))
+                db.session.commit()
+        data = json.loads(self.client().get('/questions').data)
+        self.assertNotIn(str(category_id), data['categories'])
+
+    def test_search_questions_ranked_with_snippets(self):
+        with self.app.app_context():
+            question = Question('Which zeppelin crossed the zeppelin hangar?', 'Graf', '1', 1)
+            question.insert()
+            question_id = question.id
+        try:
+            res = self.client().post('/questions', json={'searchTerm': 'Zeppelin hangar'})
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['total_questions'], 1)
+            self.assertEqual(data['questions'][0]['id'], question_id)
+            self.assertGreater(data['questions'][0]['rank'], 0)
+            self.assertIn('<mark>hangar</mark>', data['questions'][0]['snippet'])
+        finally:
+            with self.app.app_context():
+                Question.query.get(question_id).delete()
+        res = self.client().post('/questions', json={'searchTerm': 'Zeppelin hangar'})
+        self.assertEqual(json.loads(res.data)['total_questions'], 0)
+
+    def test_search_snippet_escapes_question_markup(self):
+        with self.app.app_context():
+            question = Question('<script>alert("zeppelin")</script> Which zeppelin is < 1 & lt?', 'None', '1', 1)
+            question.insert()
+            question_id = question.id
+        try:
+            res = self.client().post('/questions', json={'searchTerm': 'zeppelin lt'})
+            snippet = json.loads(res.data)['questions'][0]['snippet']
+
+            self.assertNotIn('<script>', snippet)
+            self.assertEqual(snippet, '&lt;script&gt;alert(&quot;<mark>zeppelin</mark>&quot;)&lt;/script&gt; '
+                                      'Which <mark>zeppelin</mark> is &lt; 1 &amp; <mark>lt</mark>?')
+        finally:
+            with self.app.app_context():
+                Question.query.get(question_id).delete()
+
+    def test_search_index_ignores_rolled_back_writes(self):
+        self.client().post('/questions', json={'searchTerm': 'warm up'})
+        with self.app.app_context():
+            db.session.add(Question('Which harpsichord was rolled back?', 'None', '1', 1))
+            db.session.flush()
+            db.session.rollback()
+        res = self.client().post('/questions', json={'searchTerm': 'harpsichord'})
+        data = json.loads(res.data)
+
+        self.assertEqual(data['total_questions'], 0)
+        self.assertEqual(data['questions'], [])
+
+    def test_search_index_expires(self):
+        backend = question_search.backends['index']
+        with mock.patch.object(search.time, 'time', return_value=1000):
+            self.client().post('/questions', json={'searchTerm': 'warm up'})
+        # a write the ORM events do not see, as from another process
+        with self.app.app_context():
+            db.session.execute(Question.__table__.insert().values(
+                question='Which harpsichord came from elsewhere?', answer='None', category='1', difficulty=1))
+            db.session.commit()
+        try:
+            with mock.patch.object(search.time, 'time', return_value=1000 + backend.ttl - 1):
+                res = self.client().post('/questions', json={'searchTerm': 'harpsichord'})
+                self.assertEqual(json.loads(res.data)['total_questions'], 0)
+            with mock.patch.object(search.time, 'time', return_value=1000 + backend.ttl):
+                res = self.client().post('/questions', json={'searchTerm': 'harpsichord'})
+                self.assertEqual(json.loads(res.data)['total_questions'], 1)
+        finally:
+            with self.app.app_context():
+                db.session.execute(Question.__table__.delete().where(Question.question.like('%harpsichord%')))
+                db.session.commit()
+            backend.reset()
+
+    def test_422_search_without_term(self):
+        res = self.client().post('/questions', json={'searchTerm': None})
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(json.loads(res.data)['success'], False)
+
+    def test_inverted_index_ranks_and_requires_every_word(self):
+        index = search.InvertedIndex()
+        index.add(1, 'Which river is the longest river?')
+        index.add(2, 'Which river crosses the longest border in the world?')
+        index.add(3, 'Which mountain is the highest?')
+
+        total, scored = index.search('river', 10)
+        self.assertEqual(total, 2)
+        self.assertEqual([id for id, _ in scored], [1, 2])
+        self.assertGreater(scored[0][1], scored[1][1])
+        self.assertEqual(index.search('river', 1)[0], 2)
+        self.assertEqual(index.search('longest mountain', 10), (0, []))
+        index.discard(1)
+        self.assertEqual([id for id, _ in index.search('river', 10)[1]], [2])
+        self.assertEqual(search.highlight('The River Nile', ['river']), 'The <mark>River</mark> Nile')
+
+    def play(self, client, previous, category=None):
+        res = client().post('/quizzes', json={
+            'previous_questions': previous,
+            'quiz_category': category or {'type': 'click', 'id': 0}})
+        self.assertEqual(res.status_code, 200)
+        return json.loads(res.data)['question']
+
+    def test_play_quiz_in_category_without_repeats(self):
+        category = {'type': 'Science', 'id': 1}
+        with self.app.app_context():
+            ids = set(q.id for q in Question.query.filter(Question.category == '1'))
+        previous = []
+        for _ in ids:
+            question = self.play(self.client, previous, category)
+            self.assertIn(question['id'], ids)
+            self.assertNotIn(question['id'], previous)
+            previous.append(question['id'])
+        self.assertIsNone(self.play(self.client, previous, category))
+
+    def test_play_quiz_is_repeatable_with_a_seed(self):
+        app = create_app({'quiz_seed': 42})
+        setup_db(app, self.database_path)
+        first = [self.play(app.test_client, [])['id'] for _ in range(5)]
+        app = create_app({'quiz_seed': 42})
+        setup_db(app, self.database_path)
+        self.assertEqual([self.play(app.test_client, [])['id'] for _ in range(5)], first)
+
+    def test_422_play_quiz_with_malformed_previous_questions(self):
+        res = self.client().post('/quizzes', json={'previous_questions': ['x'], 'quiz_category': {'id': 0}})
+
+        self.assertEqual(res.status_code, 422)
+
+    def test_question_sampler_invalidated_on_commit(self):
+        self.play(self.client, [], {'type': 'Science', 'id': 1})
+        with self.app.app_context():
+            db.session.add(Question('Rolled back?', 'Yes', '1', 1))
+            db.session.flush()
+            self.assertIn('1', question_sampler.ids)
+            db.session.rollback()
+            self.assertIn('1', question_sampler.ids)
+            question = Question('Committed?', 'Yes', '1', 1)
+            question.insert()
+            self.assertNotIn('1', question_sampler.ids)
+            question.delete()
+
+    def test_question_sampler_ids_expire(self):
+        loads = []
+        sampler = sampling.QuestionSampler(lambda category: loads.append(category) or [1, 2, 3], ttl=60)
+        with mock.patch.object(sampling.time, 'time', return_value=1000):
+            sampler.category_ids(1)
+            sampler.category_ids(1)
+        with mock.patch.object(sampling.time, 'time', return_value=1061):
+            sampler.category_ids(1)
+        self.assertEqual(loads, ['1', '1'])
+
+    def test_play_quiz_picks_again_when_question_was_deleted_elsewhere(self):
+        with self.app.app_context():
+            kept = Question('Kept?', 'Yes', '1', 1)
+            gone = Question('Gone?', 'Yes', '1', 1)
+            db.session.add_all([kept, gone])
+            db.session.commit()
+            kept_id, gone_id = kept.id, gone.id
+            others = [q.id for q in Question.query.filter(Question.category == '1', Question.id.notin_([kept_id, gone_id]))]
+        try:
+            self.play(self.client, others, {'type': 'Science', 'id': 1})
+            # a delete the ORM events do not see, as from another process
+            with self.app.app_context():
+                db.session.execute(Question.__table__.delete().where(Question.id == gone_id))
+                db.session.commit()
+            for _ in range(10):
+                self.assertEqual(self.play(self.client, others, {'type': 'Science', 'id': 1})['id'], kept_id)
+        finally:
+            with self.app.app_context():
+                Question.query.get(kept_id).delete()
+
+    def test_422_quiz_category_not_an_object(self):
+        for body in ({'previous_questions': [], 'quiz_category': 'Science'},
+                     {'previous_questions': [], 'quiz_category': [1]},
+                     {'previous_questions': 3, 'quiz_category': {'id': 1}},
+                     ['Science']):
+            res = self.client().post('/quizzes', json=body)
+            self.assertEqual(res.status_code, 422)
+            self.assertEqual(json.loads(res.data)['success'], False)
+        res = self.client().post('/quizzes/sessions', json={'quiz_category': 'Science'})
+        self.assertEqual(res.status_code, 422)
+
+    def test_quiz_session_plays_each_question_once(self):
+        res = self.client().post('/quizzes/sessions', json={'quiz_category': {'type': 'Science', 'id': 1}})
+        token = json.loads(res.data)['token']
+        with self.app.app_context():
+            ids = set(q.id for q in Question.query.filter(Question.category == '1'))
+        played = []
+        for _ in ids:
+            res = self.client().post('/quizzes/sessions/%s' % token)
+            played.append(json.loads(res.data)['question']['id'])
+        self.assertEqual(sorted(played), sorted(ids))
+        res = self.client().post('/quizzes/sessions/%s' % token)
+        self.assertIsNone(json.loads(res.data)['question'])
+
+    def test_404_quiz_session_unknown_token(self):
+        res = self.client().post('/quizzes/sessions/nosuchtoken')
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(json.loads(res.data)['success'], False)
+
+    def test_memory_quiz_store_bitmap_and_lru_eviction(self):
+        store = quiz_sessions.MemoryStore(maxsize=1, ttl=60)
+        store.start('a', 2)
+        for position in (3, 17, 1000):
+            store.mark('a', position)
+        self.assertEqual(store.are_seen('a', [17, 16]), [True, False])
+        self.assertEqual(quiz_sessions.bitmap_positions(store.bitmap('a')), [3, 17, 1000])
+        self.assertEqual(len(store.sessions['a'][1]), 126)
+        store.start('b', 0)
+        self.assertIsNone(store.session('a'))
+
+    def test_memory_quiz_store_expires_idle_sessions(self):
+        store = quiz_sessions.MemoryStore(maxsize=10, ttl=60)
+        with mock.patch.object(quiz_sessions.time, 'time', return_value=1000):
+            store.start('a', 2)
+        with mock.patch.object(quiz_sessions.time, 'time', return_value=1059):
+            self.assertEqual(store.session('a'), (2, None))
+        # the read above moved the expiry to 1119
+        with mock.patch.object(quiz_sessions.time, 'time', return_value=1118):
+            self.assertEqual(store.session('a'), (2, None))
+        with mock.patch.object(quiz_sessions.time, 'time', return_value=1179):
+            self.assertIsNone(store.session('a'))
+        self.assertNotIn('a', store.sessions)
+
+    def test_quiz_session_bitmap_follows_changed_ids(self):
+        ids = [10, 20, 30, 40]
+        sampler = sampling.QuestionSampler(lambda category: ids, seed=7)
+        store = quiz_sessions.MemoryStore()
+        store.start('a', 1)
+        played = quiz_sessions.Played(store, 'a', None)
+
+        def play():
+            id = sampler.pick_unseen(1, played)
+            if id is not None:
+                sampler.mark(1, played, id)
+            return id
+
+        first = [play(), play()]
+        # one bit per question of the category, not per question id
+        self.assertEqual(len(store.bitmap('a')), 1)
+        ids[:0] = [5]
+        ids.remove(first[0])
+        sampler.invalidate(1)
+        rest = []
+        while True:
+            id = play()
+            if id is None:
+                break
+            rest.append(id)
+        self.assertNotIn(first[1], rest)
+        self.assertEqual(sorted(first[1:] + rest), sorted(ids))
 
 # Make the tests conveniently executable
 if __name__ == "__main__":